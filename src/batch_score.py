@@ -0,0 +1,235 @@
+"""Value a large listings file on every core.
+
+Run from the repository root:
+
+    python src/batch_score.py listings.csv.gz valued.csv.gz --workers 8
+    python src/batch_score.py listings.jsonl - --format jsonl > valued.jsonl
+
+Each input row needs property_type ("House", "Condo/Apartment", "Land" or
+1-3), commune and size, and may have district, bedrooms and bathrooms.
+Communes are resolved to coordinates with resource/commune.json and rows
+are validated as the search form does. The output repeats every input
+column and adds price, plus error for rows that could not be valued,
+including JSON Lines lines that are not a JSON object; rows stay in input
+order. Chunks are scored by a process pool that loads the models once per
+worker, with at most --max-in-flight chunks queued, so memory does not
+grow with the file.
+"""
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from history_transfer import FORMATS, detect_format, open_text
+
+CHUNK_ROWS = 5_000  # rows sent to a worker at a time
+PROGRESS_INTERVAL = 5.0  # seconds between progress lines
+OUTPUT_COLUMNS = ("price", "error")
+PROPERTY_TYPE_NAMES = {"1": "House", "2": "Condo/Apartment", "3": "Land"}
+INVALID_LINE = "_invalid"  # key marking a JSON Lines line that is not an object; holds the error
+
+def _init_worker():
+    """Load the models and gazetteer once in each pool process."""
+    from gazetteer import get_gazetteer
+    from model import warm_up
+    get_gazetteer()
+    warm_up()
+
+def score_chunk(records):
+    """Return a (price, error) pair for each input record, in order.
+
+    Valid rows are priced with one estimate_prices_batch call; invalid ones
+    get price None and the validation message as error. If that call fails,
+    the valid rows are priced one at a time, so only the rows that fail
+    get the error and one bad row does not stop the job.
+    """
+    import numpy as np
+    from gazetteer import get_gazetteer
+    from model import estimate_prices_batch
+    from validation import SearchValidationError, validate_search
+
+    gazetteer = get_gazetteer()
+    results = [None] * len(records)
+    rows, searches = [], []
+    for row, record in enumerate(records):
+        if INVALID_LINE in record:
+            results[row] = (None, record[INVALID_LINE])
+            continue
+        property_type = str(record.get("property_type") or "").strip()
+        try:
+            search = validate_search(
+                PROPERTY_TYPE_NAMES.get(property_type, property_type), record.get("district") or None,
+                record.get("commune"), record.get("size"), record.get("bedrooms"), record.get("bathrooms"),
+                gazetteer)
+        except SearchValidationError as e:
+            results[row] = (None, str(e))
+            continue
+        rows.append(row)
+        searches.append(search)
+
+    if searches:
+        try:
+            prices = estimate_prices_batch(
+                np.array([search['property_type_id'] for search in searches]),
+                np.array([search['latitude'] for search in searches]),
+                np.array([search['longitude'] for search in searches]),
+                np.array([search['size_value'] for search in searches]),
+                np.array([search['bedrooms_value'] for search in searches]),
+                np.array([search['bathrooms_value'] for search in searches]))
+        except Exception:
+            for row, search in zip(rows, searches):
+                try:
+                    price = estimate_prices_batch([(
+                        search['property_type_id'], search['latitude'], search['longitude'],
+                        search['size_value'], search['bedrooms_value'], search['bathrooms_value'])])[0]
+                except Exception as e:
+                    results[row] = (None, f"Could not be valued: {e}")
+                else:
+                    results[row] = (float(price), None)
+        else:
+            for row, price in zip(rows, prices.tolist()):
+                results[row] = (price, None)
+    return results
+
+def _parse_line(line):
+    """Return the object on a JSON Lines line, or a record holding the raw line and why it was rejected."""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return {"line": line.rstrip("\r\n"), INVALID_LINE: f"Not valid JSON: {e}"}
+    if not isinstance(record, dict):
+        return {"line": line.rstrip("\r\n"), INVALID_LINE: "Not a JSON object"}
+    return record
+
+def _read_chunks(f, fmt, chunk_rows):
+    """Yield (header, records) with at most chunk_rows dict records each."""
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        records = reader
+    else:
+        reader = None
+        records = (_parse_line(line) for line in f if line.strip())
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_rows:
+            yield (reader.fieldnames if reader else None), chunk
+            chunk = []
+    if chunk:
+        yield (reader.fieldnames if reader else None), chunk
+
+class _Output:
+    """Writes scored records as CSV or JSON Lines."""
+
+    def __init__(self, f, fmt):
+        self.f = f
+        self.fmt = fmt
+        self.writer = None
+
+    def write(self, header, records, results):
+        if self.fmt == "csv" and self.writer is None:
+            columns = list(header or records[0])
+            columns += [column for column in OUTPUT_COLUMNS if column not in columns]
+            self.writer = csv.DictWriter(self.f, columns, extrasaction="ignore")
+            self.writer.writeheader()
+        for record, (price, error) in zip(records, results):
+            record.pop(INVALID_LINE, None)
+            record["price"] = price
+            record["error"] = error
+        if self.writer is not None:
+            self.writer.writerows(records)
+        else:
+            self.f.writelines(json.dumps(record) + "\n" for record in records)
+
+def score_file(input_path, output_path, input_format=None, output_format=None, workers=None,
+               chunk_rows=CHUNK_ROWS, max_in_flight=None, progress=None):
+    """Value every row of `input_path` into `output_path`; return (rows, errors, seconds).
+
+    `progress`, if given, is called as progress(rows_done, seconds) at most
+    every PROGRESS_INTERVAL seconds.
+    """
+    input_format = input_format or detect_format(input_path)
+    output_format = output_format or (input_format if output_path == "-" else detect_format(output_path))
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+
+    start = last_report = time.perf_counter()
+    done = errors = 0
+    source = open_text(input_path, "r")
+    sink = open_text(output_path, "w")
+    output = _Output(sink, output_format)
+
+    def write(header, records, results):
+        nonlocal done, errors, last_report
+        output.write(header, records, results)
+        done += len(records)
+        errors += sum(1 for _, error in results if error)
+        now = time.perf_counter()
+        if progress is not None and now - last_report >= PROGRESS_INTERVAL:
+            progress(done, now - start)
+            last_report = now
+
+    try:
+        chunks = _read_chunks(source, input_format, chunk_rows)
+        if workers == 1:
+            _init_worker()
+            for header, records in chunks:
+                write(header, records, score_chunk(records))
+        else:
+            # Results are written in submission order; waiting on the oldest
+            # chunk once max_in_flight are queued keeps memory bounded.
+            pending = collections.deque()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                for header, records in chunks:
+                    if len(pending) >= max_in_flight:
+                        write(*_wait(pending.popleft()))
+                    pending.append((header, records, pool.submit(score_chunk, records)))
+                while pending:
+                    write(*_wait(pending.popleft()))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+        else:
+            sink.flush()
+    return done, errors, time.perf_counter() - start
+
+def _wait(item):
+    header, records, future = item
+    return header, records, future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate prices for every row of a CSV or JSON Lines file.")
+    parser.add_argument("input", help="listings to value; .gz is decompressed, '-' is stdin")
+    parser.add_argument("output", help="file to write; .gz is compressed, '-' is stdout")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: from the extension)")
+    parser.add_argument("--output-format", choices=FORMATS, help="output format (default: from the extension)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="scoring processes (default: one per CPU; 1 scores in this process)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk sent to a worker")
+    parser.add_argument("--max-in-flight", type=int, help="most chunks queued or being scored (default: 2 x workers)")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress")
+    args = parser.parse_args()
+    try:
+        input_format = args.format or detect_format(args.input)
+        output_format = args.output_format or (input_format if args.output == "-" else detect_format(args.output))
+    except ValueError as e:
+        parser.error(str(e))
+
+    def report(rows, seconds):
+        print(f"{rows:,} rows in {seconds:.1f}s ({rows / seconds:,.0f} rows/s)", file=sys.stderr)
+
+    rows, errors, seconds = score_file(args.input, args.output, input_format, output_format, args.workers,
+                                       args.chunk_rows, args.max_in_flight, None if args.quiet else report)
+    if not args.quiet:
+        report(rows, seconds)
+        if errors:
+            print(f"{errors:,} rows could not be valued; see the error column", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Performance benchmarks for inference, the history database and the windows.
+
+Run from the repository root:
+
+    python src/benchmark.py --output bench.json
+    python src/benchmark.py --baseline bench.json --threshold 0.25
+
+Metric names ending in _s are durations (lower is better) and names ending
+in _per_s are throughputs (higher is better). With --baseline the run exits
+with status 1 if any metric is worse than the baseline by more than the
+threshold fraction.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_DB_SIZES = (10_000, 100_000, 1_000_000)
+SAMPLE_SEARCH = ('House', 'Boeng Keng Kang', 'Boeng Keng Kang Bei', '$341,060', 120.0, 4, 4)
+SAMPLE_ESTIMATES = {
+    'house': (1, 11.547598, 104.917943, 120, 4, 4),
+    'condo': (2, 11.547598, 104.917943, 80, 0, 0),
+    'land': (3, 11.547598, 104.917943, 300, 0, 0),
+}
+
+def best_of(func, repeat):
+    """Return the fastest of `repeat` timed calls, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_inference(results, batch_rows=10_000):
+    import numpy as np
+    import model
+
+    for name, args in SAMPLE_ESTIMATES.items():
+        model.prediction_cache.clear()
+        start = time.perf_counter()
+        model.estimate_price(*args)
+        results[f'estimate_price_{name}_cold_s'] = time.perf_counter() - start
+        # Repeated estimate_price calls are cache hits; time the model itself separately.
+        results[f'estimate_price_{name}_cached_s'] = best_of(lambda: model.estimate_price(*args), 1000)
+        results[f'predict_{name}_warm_s'] = best_of(lambda: model.estimate_prices_batch([args]), 1000)
+
+    rng = np.random.default_rng(0)
+    types = rng.integers(1, 4, batch_rows)
+    latitudes = rng.uniform(11.45, 11.65, batch_rows)
+    longitudes = rng.uniform(104.80, 105.00, batch_rows)
+    sizes = rng.integers(20, 1000, batch_rows)
+    rooms = rng.integers(0, 6, batch_rows)
+    elapsed = best_of(lambda: model.estimate_prices_batch(types, latitudes, longitudes, sizes, rooms, rooms), 5)
+    results['estimate_prices_batch_rows_per_s'] = batch_rows / elapsed
+
+def populate_database(rows):
+    import search_database
+
+    row = SAMPLE_SEARCH[:3] + (search_database.parse_price(SAMPLE_SEARCH[3]),) + SAMPLE_SEARCH[4:]
+    conn = search_database.get_connection()
+    with conn:
+        conn.executemany('''
+            INSERT INTO searches (property_type, district, commune, price, size, bedrooms, bathrooms, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ''', (row for _ in range(rows)))
+
+def bench_database(results, db_sizes, directory, inserts=2000):
+    import search_database
+
+    for rows in db_sizes:
+        search_database.DATABASE_NAME = os.path.join(directory, f'history_{rows}.db')
+        search_database.create_database()
+        populate_database(rows)
+
+        start = time.perf_counter()
+        for _ in range(inserts):
+            search_database.save_search(*SAMPLE_SEARCH)
+        search_database.flush_searches()
+        results[f'save_search_{rows}_rows_per_s'] = inserts / (time.perf_counter() - start)
+        results[f'get_recent_searches_{rows}_s'] = best_of(search_database.get_recent_searches, 200)
+        results[f'get_search_summary_{rows}_s'] = best_of(search_database.get_search_summary, 200)
+        search_database.close_connections()
+
+def bench_windows(results, directory):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QThreadPool
+    from PyQt6.QtWidgets import QApplication
+    import search_database
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    search_database.DATABASE_NAME = os.path.join(directory, 'windows.db')
+    search_database.create_database()
+    populate_database(10_000)
+
+    from main import BackgroundWindow
+    from result import ResultWindow
+    from search_form import PropertyPriceEstimation
+    from search_history import SearchHistoryWindow
+
+    factories = {
+        'BackgroundWindow': BackgroundWindow,
+        'PropertyPriceEstimation': PropertyPriceEstimation,
+        'ResultWindow': lambda: ResultWindow(*SAMPLE_SEARCH),
+        'SearchHistoryWindow': SearchHistoryWindow,
+    }
+    for name, factory in factories.items():
+        windows = []
+        results[f'construct_{name}_s'] = best_of(lambda: windows.append(factory()), 5)
+        # Windows start pool workers that report back to them; let those finish first.
+        QThreadPool.globalInstance().waitForDone()
+        for window in windows:
+            window.deleteLater()
+        app.processEvents()
+    # Nothing may still be reading the database when its directory is removed.
+    QThreadPool.globalInstance().waitForDone()
+
+def startup_probe():
+    """Child-process entry point: show the landing window and report when it painted."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    import search_database
+    search_database.DATABASE_NAME = os.environ.get('BENCHMARK_DATABASE', search_database.DATABASE_NAME)
+    from main import BackgroundWindow
+    window = BackgroundWindow()
+    window.show()
+    app.processEvents()
+    print('FIRST_WINDOW', flush=True)
+
+def bench_startup(results, directory, repeat=3):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen',
+               BENCHMARK_DATABASE=os.path.join(directory, 'startup.db'))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--startup-probe'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+        for line in process.stdout:
+            if line.strip() == 'FIRST_WINDOW':
+                timings.append(time.perf_counter() - start)
+                break
+        process.wait()
+    if timings:
+        results['startup_to_first_window_s'] = min(timings)
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions against `baseline`."""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if name.endswith('_per_s'):
+            change = (old - value) / old
+        else:
+            change = (value - old) / old
+        if change > threshold:
+            regressions.append(f"{name}: {old:.6g} -> {value:.6g} ({change:+.0%} worse)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks.")
+    parser.add_argument('--output', help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="fraction a metric may regress before the run fails (default 0.2)")
+    parser.add_argument('--db-sizes', type=int, nargs='+', default=list(DEFAULT_DB_SIZES),
+                        help="history table sizes to benchmark the database against")
+    parser.add_argument('--only', nargs='+', choices=['inference', 'database', 'windows', 'startup'],
+                        help="run only these groups")
+    parser.add_argument('--startup-probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        startup_probe()
+        return 0
+
+    groups = args.only or ['inference', 'database', 'windows', 'startup']
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        if 'inference' in groups:
+            bench_inference(results)
+        if 'database' in groups:
+            bench_database(results, args.db_sizes, directory)
+        if 'windows' in groups:
+            bench_windows(results, directory)
+        if 'startup' in groups:
+            bench_startup(results, directory)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'metrics': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get('metrics', baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+import search_database
+from gazetteer import get_gazetteer
+from metrics import measure, timed
+from search_database import add_save_listener, get_searches_after, get_searches_by_ids
+from spatial_index import get_commune_index
+
+COMPARABLES = 5  # past searches shown next to a result
+BUFFER_ROWS = 2048  # newest searches matched by brute force before they get a tree
+LOAD_CHUNK_ROWS = 50_000  # searches read per query while catching up with the table
+
+# Searches are compared as points in kilometres: commune centroids projected
+# as in spatial_index, plus these many km per doubling of size and per room,
+# so a same-size search one commune over ranks with a 20% larger one next door.
+SIZE_KM_PER_DOUBLING = 4.0
+ROOM_KM = 1.0
+DIMENSIONS = 5
+
+class _Level:
+    __slots__ = ('ids', 'points', 'tree')
+
+    def __init__(self, ids, points):
+        self.ids = ids
+        self.points = points
+        self.tree = cKDTree(points, balanced_tree=False, compact_nodes=False)
+
+class NeighbourIndex:
+    """Nearest-neighbour search over points that keep arriving.
+
+    A cKDTree cannot take new points, so new points go to a small buffer
+    searched by brute force. A full buffer becomes a tree, and trees of
+    similar size are merged (the logarithmic method). Each point is rebuilt
+    into a tree O(log n) times and a query visits O(log n) trees. Queries
+    read a (trees, buffer) snapshot swapped in with one assignment; add()
+    must only be called from one thread at a time.
+    """
+
+    def __init__(self, dimensions=DIMENSIONS, buffer_rows=BUFFER_ROWS):
+        self.buffer_rows = buffer_rows
+        self._state = ((), np.empty(0, dtype=np.int64), np.empty((0, dimensions)))
+
+    def __len__(self):
+        levels, buffer_ids, _ = self._state
+        return sum(len(level.ids) for level in levels) + len(buffer_ids)
+
+    def add(self, ids, points):
+        levels, buffer_ids, buffer_points = self._state
+        buffer_ids = np.concatenate([buffer_ids, ids])
+        buffer_points = np.concatenate([buffer_points, points])
+        if len(buffer_ids) >= self.buffer_rows:
+            levels = list(levels)
+            levels.append(_Level(buffer_ids, buffer_points))
+            while len(levels) >= 2 and len(levels[-1].ids) >= len(levels[-2].ids):
+                newer, older = levels.pop(), levels.pop()
+                levels.append(_Level(np.concatenate([older.ids, newer.ids]),
+                                     np.concatenate([older.points, newer.points])))
+            levels = tuple(levels)
+            buffer_ids, buffer_points = buffer_ids[:0], buffer_points[:0]
+        self._state = (levels, buffer_ids, buffer_points)
+
+    def query(self, point, k):
+        """Return (distances, ids) of the k nearest points, nearest first."""
+        levels, buffer_ids, buffer_points = self._state
+        distances = [np.sqrt(((buffer_points - point) ** 2).sum(axis=1))]
+        ids = [buffer_ids]
+        for level in levels:
+            level_distances, rows = level.tree.query(point, k=min(k, len(level.ids)))
+            distances.append(np.atleast_1d(level_distances))
+            ids.append(level.ids[np.atleast_1d(rows)])
+        distances, ids = np.concatenate(distances), np.concatenate(ids)
+        order = np.argsort(distances, kind='stable')[:k]
+        return distances[order], ids[order]
+
+class ComparablesIndex:
+    """Past searches of each property type, indexed by location, size and rooms.
+
+    The first find() reads the whole searches table; after that searches
+    are added as the writer commits them (see add_save_listener), and
+    find() reads any that other processes saved, so nothing is rebuilt.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.loaded = False
+        self._indexes = {}  # property type -> NeighbourIndex
+        self._location_codes_by_key = {}  # (commune, district) -> row of _location_table, or -1
+        self._location_table = np.empty((0, 2))  # projected (x, y) km of each known commune
+        self._lock = threading.Lock()
+
+    def _location_codes(self, districts, communes):
+        """Return each search's row in self._location_table, -1 if its commune is unknown."""
+        keys = list(zip(communes, districts))
+        missing = set(keys).difference(self._location_codes_by_key)
+        if missing:
+            gazetteer, commune_index = get_gazetteer(), get_commune_index()
+            table = [self._location_table]
+            for commune, district in missing:
+                coordinates = gazetteer.commune_coordinates(commune, district)
+                if coordinates is None:
+                    self._location_codes_by_key[(commune, district)] = -1
+                    continue
+                self._location_codes_by_key[(commune, district)] = len(self._location_table) + len(table) - 1
+                table.append(commune_index.project(*coordinates))
+            self._location_table = np.concatenate(table)
+        return np.fromiter(map(self._location_codes_by_key.__getitem__, keys), dtype=np.int64, count=len(keys))
+
+    def _points(self, codes, sizes, bedrooms, bathrooms):
+        return np.column_stack([
+            self._location_table[codes],
+            np.log2(np.maximum(np.nan_to_num(np.array(sizes, dtype=np.float64)), 1.0)) * SIZE_KM_PER_DOUBLING,
+            np.nan_to_num(np.array(bedrooms, dtype=np.float64)) * ROOM_KM,
+            np.nan_to_num(np.array(bathrooms, dtype=np.float64)) * ROOM_KM])
+
+    def _add(self, searches):
+        """Index a list of searches laid out as in get_searches_after."""
+        if not searches:
+            return
+        ids, property_types, districts, communes, _, sizes, bedrooms, bathrooms = zip(*searches)
+        ids = np.array(ids, dtype=np.int64)
+        codes = self._location_codes(districts, communes)
+        points = self._points(codes, sizes, bedrooms, bathrooms)
+        property_types = np.array(property_types, dtype=object)
+        known = codes >= 0
+        for property_type in set(property_types.tolist()):
+            rows = known & (property_types == property_type)
+            if not rows.any():
+                continue
+            index = self._indexes.get(property_type)
+            if index is None:
+                index = self._indexes[property_type] = NeighbourIndex()
+            index.add(ids[rows], points[rows])
+        self.last_id = max(self.last_id, int(ids[-1]))
+
+    def catch_up(self):
+        """Index the searches saved since the last call."""
+        with self._lock, measure("comparables.catch_up"):
+            while True:
+                rows = get_searches_after(self.last_id, LOAD_CHUNK_ROWS)
+                self._add(rows)
+                if len(rows) < LOAD_CHUNK_ROWS:
+                    break
+            self.loaded = True
+
+    def on_saved(self, database, ids, rows):
+        """Save listener: index searches as the writer commits them."""
+        if not self.loaded or database != search_database.DATABASE_NAME:
+            return
+        # Never hold up the writer; catch_up picks up anything skipped here.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if ids[0] == self.last_id + 1:
+                self._add([(search_id, *row[:7]) for search_id, row in zip(ids, rows)])
+        finally:
+            self._lock.release()
+
+    @timed("comparables.find")
+    def find(self, property_type, district, commune, size, bedrooms, bathrooms, k=COMPARABLES, exclude_id=None):
+        """Return up to k past searches most like this one, most similar first.
+
+        Rows are laid out as in get_recent_searches. `exclude_id` is the id
+        of the search being shown, which is itself in the history; identical
+        earlier searches are still listed.
+        """
+        self.catch_up()
+        index = self._indexes.get(property_type)
+        with self._lock:
+            codes = self._location_codes([district], [commune])
+        if index is None or codes[0] < 0 or not len(index):
+            return []
+        _, ids = index.query(self._points(codes, [size], [bedrooms], [bathrooms])[0], k + 1)
+        ids = ids[ids != exclude_id][:k].tolist()
+        rows = get_searches_by_ids(ids)
+        return [rows[search_id] for search_id in ids if search_id in rows]
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_comparables_index():
+    """Return the process-wide ComparablesIndex, creating it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ComparablesIndex()
+                add_save_listener(_index.on_saved)
+    return _index
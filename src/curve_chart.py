@@ -0,0 +1,81 @@
+from PyQt6.QtWidgets import QSizePolicy, QWidget
+from PyQt6.QtGui import QColor, QFont, QPainter, QPen, QPolygonF
+from PyQt6.QtCore import QPointF, QRectF, Qt
+import numpy as np
+from model import format_price
+
+class CurveChart(QWidget):
+    """Line chart of price against one input, with the entered value marked."""
+
+    MARGIN = 14
+    BACKGROUND = QColor("#2C2F33")
+    LINE = QColor("#3094CE")
+    TEXT = QColor("#FFFFFF")
+
+    def __init__(self, title, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.x = self.y = None
+        self.marker = None
+        self.message = ""
+        self.setMinimumSize(220, 160)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Preferred)
+
+    def set_curve(self, x, y, marker=None):
+        """Plot prices `y` against `x`, marking the entered value `marker`."""
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.marker = marker
+        self.message = ""
+        self.update()
+
+    def set_message(self, message):
+        """Show `message` instead of a curve, e.g. while it is computed."""
+        self.x = self.y = None
+        self.message = message
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(self.BACKGROUND)
+        painter.drawRoundedRect(QRectF(self.rect()), 10, 10)
+
+        painter.setPen(self.TEXT)
+        painter.setFont(QFont('Arial', 11, QFont.Weight.Bold))
+        title_height = painter.fontMetrics().height()
+        painter.drawText(QRectF(self.MARGIN, self.MARGIN / 2, self.width() - 2 * self.MARGIN, title_height),
+                         Qt.AlignmentFlag.AlignLeft, self.title)
+        painter.setFont(QFont('Arial', 9))
+        text_height = painter.fontMetrics().height()
+        if self.x is None or len(self.x) < 2:
+            painter.drawText(QRectF(self.rect()), Qt.AlignmentFlag.AlignCenter, self.message)
+            return
+
+        plot = QRectF(self.MARGIN, self.MARGIN + title_height + text_height,
+                      self.width() - 2 * self.MARGIN, self.height() - 2 * self.MARGIN - title_height - 2 * text_height)
+        x_low, x_high = float(self.x[0]), float(self.x[-1])
+        y_low, y_high = float(self.y.min()), float(self.y.max())
+        if y_high == y_low:
+            y_low, y_high = y_low - 1, y_high + 1
+
+        def point(x, y):
+            return QPointF(plot.left() + (x - x_low) / (x_high - x_low) * plot.width(),
+                           plot.bottom() - (y - y_low) / (y_high - y_low) * plot.height())
+
+        painter.drawText(QRectF(plot.left(), plot.top() - text_height, plot.width(), text_height),
+                         Qt.AlignmentFlag.AlignLeft, format_price(y_high))
+        painter.drawText(QRectF(plot.left(), plot.bottom(), plot.width(), text_height),
+                         Qt.AlignmentFlag.AlignLeft, f"{x_low:g}  |  low {format_price(y_low)}")
+        painter.drawText(QRectF(plot.left(), plot.bottom(), plot.width(), text_height),
+                         Qt.AlignmentFlag.AlignRight, f"{x_high:g}")
+
+        painter.setPen(QPen(self.LINE, 2))
+        painter.drawPolyline(QPolygonF([point(x, y) for x, y in zip(self.x.tolist(), self.y.tolist())]))
+
+        if self.marker is not None and x_low <= self.marker <= x_high:
+            marker = point(self.marker, float(np.interp(self.marker, self.x, self.y)))
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(self.TEXT)
+            painter.drawEllipse(marker, 4, 4)
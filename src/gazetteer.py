@@ -0,0 +1,77 @@
+import json
+import threading
+import numpy as np
+
+DISTRICT_FILE = 'resource/district.json'
+COMMUNE_FILE = 'resource/commune.json'
+
+class Gazetteer:
+    """Districts and communes with the lookups the windows need.
+
+    `coordinates` is an (n_communes, 2) float64 array of (latitude, longitude)
+    centroids in the order of `communes`; the dict indexes map names and
+    slugs to row numbers in it.
+    """
+
+    def __init__(self, district_data, commune_data):
+        self.districts = district_data
+        self.communes = commune_data
+        self.coordinates = np.array(
+            [(commune['map']['x'], commune['map']['y']) for commune in commune_data], dtype=np.float64)
+
+        self.district_by_name = {district['en_name']: district for district in district_data}
+        self.district_by_slug = {district['slug']: district for district in district_data}
+        self._rows_by_name = {}
+        self._rows_by_district = {}
+        self._row_by_district_and_name = {}
+        for row, commune in enumerate(commune_data):
+            self._rows_by_name.setdefault(commune['en_name'], []).append(row)
+            self._rows_by_district.setdefault(commune['district_slug'], []).append(row)
+            self._row_by_district_and_name[(commune['district_slug'], commune['en_name'])] = row
+
+    def district_slug(self, district):
+        """Return the slug of a district given its English name or slug."""
+        if district in self.district_by_slug:
+            return district
+        found = self.district_by_name.get(district)
+        return found['slug'] if found else district.lower().replace(" ", "-")
+
+    def commune_names(self, district):
+        """Return the English names of the communes in a district."""
+        rows = self._rows_by_district.get(self.district_slug(district), [])
+        return [self.communes[row]['en_name'] for row in rows]
+
+    def commune_row(self, commune_name, district=None):
+        """Return the row of a commune, or None if it is unknown.
+
+        Commune names are only unique within a district, so pass the
+        district when it is known; without it the first match wins.
+        """
+        if district is not None:
+            return self._row_by_district_and_name.get((self.district_slug(district), commune_name))
+        rows = self._rows_by_name.get(commune_name)
+        return rows[0] if rows else None
+
+    def commune_coordinates(self, commune_name, district=None):
+        """Return the (latitude, longitude) centroid of a commune, or None."""
+        row = self.commune_row(commune_name, district)
+        if row is None:
+            return None
+        latitude, longitude = self.coordinates[row]
+        return float(latitude), float(longitude)
+
+_gazetteer = None
+_lock = threading.Lock()
+
+def get_gazetteer():
+    """Return the process-wide Gazetteer, reading the JSON files on first use."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                with open(DISTRICT_FILE, 'r') as f:
+                    district_data = json.load(f)
+                with open(COMMUNE_FILE, 'r') as f:
+                    commune_data = json.load(f)
+                _gazetteer = Gazetteer(district_data, commune_data)
+    return _gazetteer
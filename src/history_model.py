@@ -0,0 +1,133 @@
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from model import format_price
+from search_database import get_searches_page
+
+PAGE_SIZE = 200
+
+class SearchHistoryModel(QAbstractTableModel):
+    """Table model over the searches table that fetches pages on demand.
+
+    Rows are loaded PAGE_SIZE at a time with keyset pagination as the view
+    scrolls (canFetchMore/fetchMore). Every fetched row keeps all of its
+    columns, so search_at() can hand out the details without another query.
+    refresh() adds only the searches saved since the newest fetched row.
+    """
+
+    HEADERS = ["Property Type", "District", "Commune", "Price"]
+    # Table column -> searches column used when sorting by it.
+    SORT_COLUMNS = {0: "property_type", 1: "district", 2: "commune", 3: "price"}
+    # searches column -> position in a fetched row.
+    ROW_POSITIONS = {"id": 0, "property_type": 1, "district": 2, "commune": 3, "price": 4}
+    PRICE_POSITION = 4
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._exhausted = False
+        self._sort_column = "id"
+        self._descending = True
+        self._filters = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            position = index.column() + 1
+            value = self._rows[index.row()][position]
+            if value is None:
+                return ""
+            if position == self.PRICE_POSITION:
+                return format_price(value)
+            return str(value)
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        if role == Qt.ItemDataRole.UserRole:
+            return self._rows[index.row()][0]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        page = get_searches_page(self._last_key(), PAGE_SIZE, self._sort_column, self._descending, self._filters)
+        if len(page) < PAGE_SIZE:
+            self._exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        sort_column = self.SORT_COLUMNS.get(column, "id")
+        descending = order == Qt.SortOrder.DescendingOrder if sort_column != "id" else True
+        if (sort_column, descending) != (self._sort_column, self._descending):
+            self._sort_column, self._descending = sort_column, descending
+            self.reload()
+
+    def set_filters(self, **filters):
+        """Only show searches whose columns equal the given non-empty values."""
+        filters = {column: value for column, value in filters.items() if value}
+        if filters != self._filters:
+            self._filters = filters
+            self.reload()
+
+    def filters(self):
+        """Return the filters currently applied, as passed to set_filters."""
+        return dict(self._filters)
+
+    def reload(self):
+        """Drop every fetched row and start again from the first page."""
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def refresh(self):
+        """Insert searches saved since the last fetch at the top of the table.
+
+        Only rows with an id above the newest one already fetched are read,
+        so reopening the history costs nothing when no search was saved.
+        Other sort orders can place new rows anywhere and reload instead.
+        """
+        if self._sort_column != "id" or not self._rows:
+            self.reload()
+            return
+        newest = self._rows[0][0]
+        new_rows = []
+        while True:
+            page = get_searches_page(newest, PAGE_SIZE, "id", False, self._filters)
+            new_rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            newest = page[-1][0]
+        if new_rows:
+            new_rows.reverse()
+            self.beginInsertRows(QModelIndex(), 0, len(new_rows) - 1)
+            self._rows[:0] = new_rows
+            self.endInsertRows()
+
+    def search_at(self, row):
+        """Return the full (id, type, district, commune, price, size, bedrooms, bathrooms) row."""
+        return self._rows[row]
+
+    def _last_key(self):
+        if not self._rows:
+            return None
+        last = self._rows[-1]
+        if self._sort_column == "id":
+            return last[0]
+        return (last[self.ROW_POSITIONS[self._sort_column]], last[0])
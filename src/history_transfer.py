@@ -0,0 +1,198 @@
+"""Stream the search history out to, or in from, CSV and JSON Lines files.
+
+Run from the repository root:
+
+    python src/history_transfer.py export history.csv.gz
+    python src/history_transfer.py import history.jsonl --database other.db
+
+The format follows the file extension (.csv or .jsonl, optionally with .gz)
+or --format. '-' reads stdin or writes stdout. Rows are streamed in chunks,
+so memory stays bounded whatever the file size. Imported rows that match
+an existing search in every column except id and model_version are skipped;
+files written before model_version was exported import with it empty, so
+revalue_history prices those searches again.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+import search_database
+from search_database import create_database, flush_searches, get_connection, parse_price
+
+COLUMNS = ("id", "property_type", "district", "commune", "price", "size", "bedrooms", "bathrooms", "created_at",
+           "model_version")
+# Columns copied on import; ids are local to each database and are reassigned.
+IMPORT_COLUMNS = COLUMNS[1:]
+# Columns compared to find duplicates; a revalued copy of a search is still the same search.
+MATCH_COLUMNS = IMPORT_COLUMNS[:-1]
+FORMATS = ("csv", "jsonl")
+CHUNK_ROWS = 10_000  # rows read or written per fetchmany/executemany call
+TRANSACTION_ROWS = 200_000  # rows imported per committed transaction
+IMPORT_CACHE_MB = 256  # page cache while importing; the indexes are updated in random order
+
+def _parsers():
+    def optional(convert):
+        return lambda value: None if value in (None, "") else convert(value)
+    return {
+        "property_type": optional(str),
+        "district": optional(str),
+        "commune": optional(str),
+        "price": optional(parse_price),
+        "size": optional(float),
+        "bedrooms": optional(lambda value: int(float(value))),
+        "bathrooms": optional(lambda value: int(float(value))),
+        "created_at": optional(str),
+        "model_version": optional(str),
+    }
+
+def detect_format(path):
+    """Return 'csv' or 'jsonl' from a file name, ignoring a .gz suffix."""
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass --format")
+
+def open_text(path, mode):
+    """Open `path` as text, through gzip if it ends in .gz; '-' is stdin/stdout."""
+    if path == "-":
+        stream = sys.stdin if mode == "r" else sys.stdout
+        return io.TextIOWrapper(stream.buffer, encoding="utf-8", newline="") if mode == "r" else stream
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+def export_searches(path, fmt=None, chunk_rows=CHUNK_ROWS):
+    """Write every search to `path` in id order and return the row count."""
+    fmt = fmt or detect_format(path)
+    flush_searches()
+    # One SELECT is one read transaction, so the export is a consistent
+    # snapshot even while the app keeps saving searches.
+    cursor = get_connection().execute(f"SELECT {', '.join(COLUMNS)} FROM searches ORDER BY id")
+    count = 0
+    f = open_text(path, "w")
+    try:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(COLUMNS)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            if writer is not None:
+                writer.writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(COLUMNS, row))) + "\n" for row in rows)
+            count += len(rows)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+        else:
+            f.flush()
+    return count
+
+def _read_records(f, fmt):
+    """Yield each input row as a dict of column -> raw value."""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+def _chunks(records, chunk_rows):
+    parsers = _parsers()
+    chunk = []
+    for record in records:
+        chunk.append(tuple(parsers[column](record.get(column)) for column in IMPORT_COLUMNS))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_searches(path, fmt=None, chunk_rows=CHUNK_ROWS, transaction_rows=TRANSACTION_ROWS, deduplicate=True):
+    """Append the searches in `path` to the database and return (read, inserted).
+
+    Each chunk goes through a temporary staging table so duplicates, both
+    within the file and against rows already stored, are dropped in SQL.
+    """
+    fmt = fmt or detect_format(path)
+    create_database()
+    flush_searches()
+    conn = get_connection()
+    columns = ", ".join(IMPORT_COLUMNS)
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_staging ({columns})")
+    conn.execute("DELETE FROM import_staging")
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    conn.execute(f"PRAGMA cache_size = -{IMPORT_CACHE_MB * 1024}")
+    if deduplicate:
+        # IS treats NULLs as equal; the created_at comparison uses its index.
+        matches = " AND ".join(f"s.{column} IS staged.{column}" for column in MATCH_COLUMNS)
+        copy = f'''
+            INSERT INTO searches ({columns})
+            SELECT DISTINCT {columns} FROM import_staging AS staged
+            WHERE NOT EXISTS (SELECT 1 FROM searches AS s WHERE {matches})
+        '''
+    else:
+        copy = f"INSERT INTO searches ({columns}) SELECT {columns} FROM import_staging"
+
+    read = inserted = uncommitted = 0
+    f = open_text(path, "r")
+    try:
+        for chunk in _chunks(_read_records(f, fmt), chunk_rows):
+            conn.executemany(f"INSERT INTO import_staging VALUES ({', '.join('?' * len(IMPORT_COLUMNS))})", chunk)
+            inserted += conn.execute(copy).rowcount
+            conn.execute("DELETE FROM import_staging")
+            read += len(chunk)
+            uncommitted += len(chunk)
+            if uncommitted >= transaction_rows:
+                conn.commit()
+                uncommitted = 0
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA cache_size = {cache_size}")
+        if f is not sys.stdin:
+            f.close()
+    return read, inserted
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the search history as CSV or JSON Lines.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="file to write or read; .gz is (de)compressed, '-' is stdout/stdin")
+    parser.add_argument("--format", choices=FORMATS, help="file format (default: from the extension)")
+    parser.add_argument("--database", default=search_database.DATABASE_NAME,
+                        help=f"history database (default {search_database.DATABASE_NAME})")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per read or write batch")
+    parser.add_argument("--keep-duplicates", action="store_true", help="import rows even if already stored")
+    args = parser.parse_args()
+    if args.path == "-" and not args.format:
+        parser.error("--format is required with '-'")
+    try:
+        fmt = args.format or detect_format(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+
+    search_database.DATABASE_NAME = args.database
+    start = time.perf_counter()
+    if args.command == "export":
+        create_database()
+        count = export_searches(args.path, fmt, args.chunk_rows)
+        summary = f"exported {count:,} searches"
+    else:
+        count, inserted = import_searches(args.path, fmt, args.chunk_rows,
+                                          deduplicate=not args.keep_duplicates)
+        summary = f"read {count:,} searches, inserted {inserted:,}"
+    elapsed = time.perf_counter() - start
+    print(f"{summary} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
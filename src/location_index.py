@@ -0,0 +1,132 @@
+import bisect
+import re
+import threading
+import unicodedata
+import numpy as np
+from gazetteer import get_gazetteer
+
+FUZZY_MIN_QUERY = 3  # characters typed before trigram matching kicks in
+FUZZY_MIN_SCORE = 0.5  # share of the query's trigrams an entry must contain
+
+# Scores: exact name > name prefix > word prefix > fuzzy (below 1).
+EXACT, NAME_PREFIX, WORD_PREFIX = 4.0, 3.0, 2.0
+
+_SEPARATORS = re.compile(r"[\s\-_'.,/()]+")
+# Letters NFKD does not decompose, as in "Bœng".
+_LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae', 'ø': 'o', 'đ': 'd', 'ł': 'l'})
+
+def normalize(text):
+    """Fold case and Latin accents and collapse separators, keeping Khmer intact."""
+    text = (text or '').casefold()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text.translate(_LIGATURES))
+        # Only strip Latin combining accents; Khmer vowel signs are combining marks too.
+        text = ''.join(ch for ch in text if not '\u0300' <= ch <= '\u036f')
+        text = unicodedata.normalize('NFC', text)
+    return _SEPARATORS.sub(' ', text).strip()
+
+def _trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Location:
+    """One district or commune the search field can resolve to."""
+
+    __slots__ = ('kind', 'en_name', 'km_name', 'district', 'label')
+
+    def __init__(self, kind, en_name, km_name, district):
+        self.kind = kind  # 'district' or 'commune'
+        self.en_name = en_name
+        self.km_name = km_name
+        self.district = district  # English name of the district (itself for a district)
+        if kind == 'district':
+            self.label = f"{en_name} ({km_name}) - district"
+        else:
+            self.label = f"{en_name} ({km_name}) - {district}"
+
+class LocationIndex:
+    """Prefix and trigram index over district and commune names.
+
+    Every entry is indexed by its English name, Khmer name and slug after
+    normalize(). Prefix matches come from a sorted term list searched with
+    bisect; when they do not fill the result, entries sharing enough
+    trigrams with the query are added, so typos still find a match.
+    """
+
+    def __init__(self, districts, communes):
+        district_names = {district['slug']: district['en_name'] for district in districts}
+        self.locations = [Location('district', d['en_name'], d['km_name'], d['en_name']) for d in districts]
+        self.locations += [Location('commune', c['en_name'], c['km_name'],
+                                    district_names.get(c['district_slug'], c['district_slug']))
+                           for c in communes]
+        sources = [(d['en_name'], d['km_name'], d['slug']) for d in districts]
+        sources += [(c['en_name'], c['km_name'], c['slug']) for c in communes]
+
+        terms = []  # (term, entry, score for a match at the start of the term)
+        postings = {}
+        self._name_lengths = np.empty(len(sources), dtype=np.int64)
+        for entry, names in enumerate(sources):
+            normalized = {normalize(name) for name in names if name}
+            self._name_lengths[entry] = min((len(name) for name in normalized), default=0)
+            for name in normalized:
+                terms.append((name, entry, NAME_PREFIX))
+                words = name.split(' ')
+                for start in range(1, len(words)):
+                    terms.append((' '.join(words[start:]), entry, WORD_PREFIX))
+            for trigram in set().union(*(_trigrams(name) for name in normalized)):
+                postings.setdefault(trigram, []).append(entry)
+        terms.sort()
+        self._terms = [term for term, _, _ in terms]
+        self._term_entries = np.array([entry for _, entry, _ in terms], dtype=np.int64)
+        self._term_scores = np.array([score for _, _, score in terms])
+        self._postings = {trigram: np.array(entries, dtype=np.int64) for trigram, entries in postings.items()}
+
+    def search(self, query, limit=10):
+        """Return up to `limit` Locations matching `query`, best first."""
+        query = normalize(query)
+        if not query:
+            return []
+        start = bisect.bisect_left(self._terms, query)
+        # Every term starting with query sorts before query + the highest code point. All of
+        # them are ranked; cutting the range first would keep the alphabetically first, not the best.
+        end = bisect.bisect_left(self._terms, query + '\U0010ffff', start)
+        exact_end = bisect.bisect_right(self._terms, query, start, end)
+        entries = self._term_entries[start:end]
+        prefix_scores = self._term_scores[start:end].copy()
+        prefix_scores[:exact_end - start][prefix_scores[:exact_end - start] == NAME_PREFIX] = EXACT
+
+        if np.unique(entries).size < limit and len(query) >= FUZZY_MIN_QUERY:
+            trigrams = _trigrams(query)
+            postings = [self._postings[trigram] for trigram in trigrams if trigram in self._postings]
+            if postings:
+                shared = np.bincount(np.concatenate(postings), minlength=len(self.locations))
+                fraction = shared / len(trigrams)
+                candidates = np.flatnonzero(fraction >= FUZZY_MIN_SCORE)
+                if candidates.size > limit:
+                    candidates = candidates[np.argpartition(-fraction[candidates], limit)[:limit]]
+                # Scaled below 1 so fuzzy matches never outrank a prefix match.
+                entries = np.concatenate([entries, candidates])
+                prefix_scores = np.concatenate([prefix_scores, fraction[candidates] * 0.99])
+
+        # Best score first, then shorter names; an entry keeps its first (best) position.
+        order = np.lexsort((entries, self._name_lengths[entries], -prefix_scores))
+        ranked = []
+        for entry in entries[order].tolist():
+            if entry not in ranked:
+                ranked.append(entry)
+                if len(ranked) == limit:
+                    break
+        return [self.locations[entry] for entry in ranked]
+
+_index = None
+_lock = threading.Lock()
+
+def get_location_index():
+    """Return the process-wide LocationIndex, built from the gazetteer on first use."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                gazetteer = get_gazetteer()
+                _index = LocationIndex(gazetteer.districts, gazetteer.communes)
+    return _index
@@ -1,29 +1,47 @@
 import sys
+import time
+
+STARTED_AT = time.perf_counter()
+
 from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QLineEdit, QComboBox
-from PyQt6.QtGui import QPixmap, QPalette, QBrush, QFont
-from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QPalette, QBrush, QFont
+from PyQt6.QtCore import Qt, QThreadPool, QTimer
 from PyQt6.QtGui import QFont
-from search_form import PropertyPriceEstimation
 from search_database import create_database
+from metrics import observe, timed
+from resources import background_pixmap, logo_pixmap, preload
+from stall_watchdog import install as install_stall_watchdog
+
+# The search form and the models are imported after the landing window has
+# painted (see BackgroundWindow.start_warmup), so they don't delay it.
+IMPORTED_AT = time.perf_counter()
+
+def report_timing(name, seconds):
+    """Record a startup timing, and print it when run with --timings."""
+    observe(f"startup.{name}", seconds)
+    if "--timings" in sys.argv:
+        print(f"{name}: {seconds * 1000:.0f} ms", file=sys.stderr)
 
 class BackgroundWindow(QWidget):
+    @timed("BackgroundWindow.__init__")
     def __init__(self):
         super().__init__()
+        self.warmup = None
+        self.warmup_error = None
+        self.form_window = None
+        self.painted_at = None
         create_database()
         self.setGeometry(100, 100, 1440, 1024)
         
         palette = QPalette()
-        pixmap = QPixmap("resource/background.png") 
-        palette.setBrush(QPalette.ColorRole.Window, QBrush(pixmap))
+        palette.setBrush(QPalette.ColorRole.Window, QBrush(background_pixmap()))
         self.setPalette(palette)
         
         layout = QVBoxLayout()
         layout.setAlignment(Qt.AlignmentFlag.AlignTop) 
         
         logo_label = QLabel(self)
-        logo_pixmap = QPixmap("resource/logo.png")
-        logo_pixmap = logo_pixmap.scaled(193, 193, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-        logo_label.setPixmap(logo_pixmap)
+        logo_label.setPixmap(logo_pixmap())
         logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(logo_label)
         
@@ -54,14 +72,49 @@ class BackgroundWindow(QWidget):
         layout.addWidget(get_start_button, alignment=Qt.AlignmentFlag.AlignCenter)
         
         self.setLayout(layout)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.painted_at is None:
+            self.painted_at = time.perf_counter()
+            # Start the warm-up after this paint, not during it.
+            QTimer.singleShot(0, self.on_first_paint)
+
+    def on_first_paint(self):
+        """Report startup timings and start loading the models."""
+        report_timing("imports", IMPORTED_AT - STARTED_AT)
+        report_timing("first_paint", self.painted_at - STARTED_AT)
+        self.start_warmup()
+
+    def start_warmup(self):
+        """Load the models and the prediction cache on a background thread."""
+        from workers import ModelWarmupWorker
+        self.warmup = ModelWarmupWorker()
+        self.warmup.signals.finished.connect(lambda seconds: report_timing("model_warmup", seconds))
+        self.warmup.signals.failed.connect(self.on_warmup_failed)
+        QThreadPool.globalInstance().start(self.warmup)
+
+    def on_warmup_failed(self, details):
+        """Tell the user the models could not be loaded, now or once the form opens."""
+        self.warmup_error = details
+        if self.form_window is not None:
+            self.form_window.show_model_error(details)
+
     def open_form(self):
+        from search_form import PropertyPriceEstimation
         self.form_window = PropertyPriceEstimation()
         self.form_window.show()
         self.close()
+        if self.warmup_error is not None:
+            self.form_window.show_model_error(self.warmup_error)
         
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    # Reports event-loop stalls when HOME_EVA_STALL_MS is set.
+    stall_watchdog = install_stall_watchdog(app)
+    preload()
     window = BackgroundWindow()
+    # The first paintEvent reports the startup timings and starts the warm-up.
     window.show()
     sys.exit(app.exec())
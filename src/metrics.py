@@ -0,0 +1,191 @@
+"""Opt-in timing instrumentation for the valuation path.
+
+Set HOME_EVA_METRICS=1 to record latency histograms and counters for every
+function wrapped with @timed or measure(). They are written to
+HOME_EVA_METRICS_FILE (default "metrics") as .json and .prom (Prometheus
+text format) at exit, or whenever dump_metrics() is called.
+Set HOME_EVA_PROFILE=N to also cProfile each instrumented call and keep the
+profiles of the N slowest ones in the JSON dump.
+
+With neither variable set, @timed returns the function unchanged and
+measure() returns a shared no-op context manager.
+"""
+import atexit
+import cProfile
+import functools
+import heapq
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import nullcontext
+
+PROFILE_SLOWEST = int(os.environ.get("HOME_EVA_PROFILE", "0") or 0)
+ENABLED = os.environ.get("HOME_EVA_METRICS", "") not in ("", "0") or PROFILE_SLOWEST > 0
+METRICS_FILE = os.environ.get("HOME_EVA_METRICS_FILE", "metrics")
+
+# Histogram upper bounds in seconds.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_local = threading.local()
+_histograms = {}
+_counters = {}
+_slowest = []  # min-heap of (seconds, sequence, name, profile text)
+_sequence = 0
+
+class Histogram:
+    """Call count, total, maximum and per-bucket counts of one timed name."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self):
+        cumulative, running = {}, 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.maximum,
+            "mean": self.total / self.count if self.count else 0.0,
+            "buckets": cumulative,
+        }
+
+def observe(name, seconds):
+    """Record one duration for `name`."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+def increment(name, value=1):
+    """Add `value` to the counter `name`."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+class _Timer:
+    __slots__ = ("name", "start", "profiler")
+
+    def __init__(self, name):
+        self.name = name
+        self.profiler = None
+
+    def __enter__(self):
+        if PROFILE_SLOWEST and not getattr(_local, "profiling", False):
+            # cProfile cannot nest, so only the outermost instrumented call is profiled.
+            try:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+                _local.profiling = True
+            except ValueError:
+                self.profiler = None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        observe(self.name, seconds)
+        if self.profiler is not None:
+            self.profiler.disable()
+            _local.profiling = False
+            _keep_if_slow(self.name, seconds, self.profiler)
+        return False
+
+def _keep_if_slow(name, seconds, profiler):
+    global _sequence
+    with _lock:
+        if len(_slowest) >= PROFILE_SLOWEST and seconds <= _slowest[0][0]:
+            return
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(25)
+    with _lock:
+        _sequence += 1
+        entry = (seconds, _sequence, name, text.getvalue())
+        if len(_slowest) < PROFILE_SLOWEST:
+            heapq.heappush(_slowest, entry)
+        elif seconds > _slowest[0][0]:
+            heapq.heapreplace(_slowest, entry)
+
+def measure(name):
+    """Context manager timing its block under `name`."""
+    if not ENABLED:
+        return _NOOP
+    return _Timer(name)
+
+def timed(name):
+    """Decorator timing every call of the function under `name`."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot():
+    """Return every histogram, counter and kept profile as plain data."""
+    with _lock:
+        return {
+            "histograms": {name: histogram.as_dict() for name, histogram in sorted(_histograms.items())},
+            "counters": dict(sorted(_counters.items())),
+            "slowest_calls": [
+                {"name": name, "seconds": seconds, "profile": profile}
+                for seconds, _, name, profile in sorted(_slowest, reverse=True)
+            ],
+        }
+
+def prometheus_text():
+    """Return the metrics in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = ["# TYPE home_eva_call_duration_seconds histogram"]
+    for name, histogram in data["histograms"].items():
+        for bound, count in histogram["buckets"].items():
+            lines.append(f'home_eva_call_duration_seconds_bucket{{name="{name}",le="{bound}"}} {count}')
+        lines.append(f'home_eva_call_duration_seconds_sum{{name="{name}"}} {histogram["sum"]}')
+        lines.append(f'home_eva_call_duration_seconds_count{{name="{name}"}} {histogram["count"]}')
+    lines.append("# TYPE home_eva_events_total counter")
+    for name, value in data["counters"].items():
+        lines.append(f'home_eva_events_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def dump_metrics(path=None):
+    """Write the metrics to `path`.json and `path`.prom."""
+    path = path or METRICS_FILE
+    with open(f"{path}.json", "w") as f:
+        json.dump(snapshot(), f, indent=2)
+    with open(f"{path}.prom", "w") as f:
+        f.write(prometheus_text())
+
+def reset():
+    """Forget everything recorded so far."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _slowest.clear()
+
+if ENABLED:
+    atexit.register(dump_metrics)
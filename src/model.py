@@ -1,19 +1,212 @@
-import pickle
+import warnings
+import numpy as np
+from metrics import increment, timed
+from model_registry import WATCH_INTERVAL, ModelRegistry
+from prediction_cache import PredictionCache
+from price_tiles import TILES_DIR, TileStore
 
-house_model = pickle.load(open('model/house_gb.sav', 'rb'))
-condo_model = pickle.load(open('model/condo_gb.sav', 'rb'))
-land_model = pickle.load(open('model/land_gb.sav', 'rb'))
+MODEL_FILES = {
+    1: 'model/house_gb.sav',
+    2: 'model/condo_gb.sav',
+    3: 'model/land_gb.sav',
+}
 
+# property_type id -> number of feature columns its model was trained on
+N_FEATURES = {1: 5, 2: 3, 3: 3}
+
+# The models were fitted on a DataFrame but are always given plain arrays in
+# N_FEATURES column order. sklearn resets the warning registry on every
+# predict, so without this filter each batch repeats the warning.
+warnings.filterwarnings("ignore", message="X does not have valid feature names", category=UserWarning)
+
+# Models are loaded on first use, per property type (see get_model), so
+# importing this module does not pull in sklearn or read every model file.
+# The registry also swaps in new versions of the files; see watch_models.
+_MODEL_NAMES = {'house_model': 1, 'condo_model': 2, 'land_model': 3}
+registry = ModelRegistry(MODEL_FILES, N_FEATURES)
+
+# property_type -> SHA-256 of the model file in use; kept current by the registry.
+MODEL_VERSIONS = registry.versions
+
+# Memoizes estimate_price; call prediction_cache.attach_database() to keep
+# entries across restarts.
+prediction_cache = PredictionCache(MODEL_VERSIONS, max_size=1024)
+
+def get_model(property_type):
+    """Return (sklearn model, compiled model) for a type, loading it on first use.
+
+    Safe to call from several threads; later callers wait for a load in
+    progress, which is how a search made during warm-up waits for its model.
+    """
+    loaded = registry.get(property_type)
+    return loaded.model, loaded.compiled
+
+def is_model_loaded(property_type):
+    return registry.is_loaded(property_type)
+
+def warm_up(property_types=None):
+    """Load the models for `property_types` (default: all) ahead of use."""
+    for property_type in property_types or MODEL_FILES:
+        get_model(property_type)
+
+def watch_models(interval=WATCH_INTERVAL):
+    """Swap in retrained model files as they are deployed, without a restart."""
+    registry.watch(interval)
+
+def _on_model_version(property_type, version):
+    global tile_store
+    prediction_cache.set_model_version(property_type, version)
+    if tile_store is not None:
+        # Tiles built from the old model are stale; use them only if rebuilt.
+        tile_store = TileStore.open(tile_directory, MODEL_VERSIONS)
+
+registry.add_listener(_on_model_version)
+
+def __getattr__(name):
+    # house_model, condo_model and land_model stay importable, loaded lazily.
+    if name in _MODEL_NAMES:
+        return get_model(_MODEL_NAMES[name])[0]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Precomputed price grids answering grid-aligned queries; see enable_tile_lookup.
+tile_store = None
+tile_directory = TILES_DIR
+tile_interpolate = True
+
+# Each loaded model is also flattened by compile_ensemble; the compiled copy
+# gives the same results as predict but skips sklearn's per-call validation,
+# which dominates small batches. Above this many rows sklearn's Cython tree
+# walk is faster than the NumPy-vectorized one (see `python src/tree_engine.py`).
+COMPILED_MAX_ROWS = 64
+
+def format_price(price):
+    """Format a raw price the way the UI and the search history show it."""
+    return '${:,.0f}'.format(price)
+
+def enable_tile_lookup(directory=TILES_DIR, interpolate=True):
+    """Answer estimate_price from precomputed tiles where possible.
+
+    Tiles built by `python src/price_tiles.py` are memory-mapped and used
+    for commune centroids on the size/room grid, interpolating between grid
+    sizes if `interpolate` is set. Every other query still runs the models.
+    Returns False, leaving lookups off, if the tiles are missing or were
+    built from different model files.
+    """
+    global tile_store, tile_directory, tile_interpolate
+    tile_store = TileStore.open(directory, MODEL_VERSIONS)
+    tile_directory = directory
+    tile_interpolate = interpolate
+    return tile_store is not None
+
+def disable_tile_lookup():
+    global tile_store
+    tile_store = None
+
+@timed("model.estimate_price")
 def estimate_price(property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value):
-    result = []
-    if property_type == 1:
-        result = house_model.predict([[latitude, longitude, size_value, bedrooms_value, bathrooms_value]])
-    if property_type == 2:
-        result = condo_model.predict([[latitude, longitude, size_value]])
-    if property_type == 3:
-        result = land_model.predict([[latitude, longitude, size_value]])
-    # price = '%.0f'%(result[0])
-    return '${:,.0f}'.format(result[0])
+    key = prediction_cache.key(property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value)
+    if tile_store is not None:
+        price = tile_store.lookup(*key, interpolate=tile_interpolate)
+        if price is not None:
+            increment("model.estimate_price.tile_hits")
+            return format_price(price)
+    price = prediction_cache.get(key)
+    if price is None:
+        increment("model.estimate_price.live")
+        version = MODEL_VERSIONS[key[0]]
+        price = estimate_prices_batch([key])[0]
+        # Don't file a price from a model swapped out meanwhile under the new version.
+        if MODEL_VERSIONS[key[0]] == version:
+            prediction_cache.put(key, price)
+    return format_price(price)
+
+def _records_to_columns(records):
+    """Turn an iterable of records into a (n, 6) float64 array.
+
+    A record is either a sequence in estimate_price argument order or a dict
+    keyed by the estimate_price argument names. Missing room counts become
+    0; a missing property type, latitude, longitude or size raises ValueError.
+    """
+    keys = ('property_type', 'latitude', 'longitude', 'size_value', 'bedrooms_value', 'bathrooms_value')
+    rows = []
+    for number, record in enumerate(records):
+        if isinstance(record, dict):
+            record = [record.get(key) for key in keys]
+        record = list(record) + [None] * (len(keys) - len(record))
+        for key, value in zip(keys[:4], record):
+            if value is None:
+                raise ValueError(f"Record {number} has no {key}")
+        rows.append([0 if value is None else value for value in record])
+    if not rows:
+        return np.empty((0, 6), dtype=np.float64)
+    return np.asarray(rows, dtype=np.float64).reshape(len(rows), 6)
+
+@timed("model.estimate_prices_batch")
+def estimate_prices_batch(property_types, latitudes=None, longitudes=None, sizes=None, bedrooms=None, bathrooms=None):
+    """Estimate raw prices for many rows with one predict call per model.
+
+    Either pass parallel array-likes for every column, or pass an iterable of
+    records as the only argument (see _records_to_columns). bedrooms and
+    bathrooms may be omitted and default to 0; they are only used by the
+    house model. Returns a float64 array of prices in input order; use
+    format_price to turn a value into display text. Raises ValueError for a
+    missing latitude, longitude or size, or a property type that is not a
+    whole number.
+    """
+    if latitudes is None:
+        table = _records_to_columns(property_types)
+        property_types = table[:, 0]
+        features = table[:, 1:]
+    else:
+        if longitudes is None or sizes is None:
+            raise ValueError("latitudes, longitudes and sizes are required")
+        property_types = np.asarray(property_types, dtype=np.float64)
+        count = len(property_types)
+        columns = [latitudes, longitudes, sizes,
+                   np.zeros(count) if bedrooms is None else bedrooms,
+                   np.zeros(count) if bathrooms is None else bathrooms]
+        features = np.column_stack([np.asarray(column, dtype=np.float64) for column in columns])
+        # Missing room counts are 0, as for records.
+        features[:, 3:] = np.nan_to_num(features[:, 3:], nan=0.0)
+
+    # None in an array-like column arrives here as NaN.
+    missing = np.isnan(features[:, :3]).any(axis=0)
+    if missing.any():
+        names = [name for name, absent in zip(('latitude', 'longitude', 'size'), missing) if absent]
+        raise ValueError(f"Missing {', '.join(names)} in some rows")
+    if not np.array_equal(property_types, np.round(property_types)):
+        raise ValueError("Property types must be whole numbers")
+    property_types = property_types.astype(np.int64)
+    unknown = np.setdiff1d(property_types, list(MODEL_FILES))
+    if unknown.size:
+        raise ValueError(f"Unknown property type(s): {unknown.tolist()}")
+
+    prices = np.empty(len(property_types), dtype=np.float64)
+    for property_type, n_features in N_FEATURES.items():
+        rows = np.flatnonzero(property_types == property_type)
+        if rows.size == 0:
+            continue
+        model, compiled = get_model(property_type)
+        if rows.size <= COMPILED_MAX_ROWS:
+            prices[rows] = compiled.predict(features[rows, :n_features])
+        else:
+            prices[rows] = model.predict(features[rows, :n_features])
+    return prices
+
+def estimate_prices_at_coordinates(property_types, latitudes, longitudes, sizes, bedrooms=None, bathrooms=None):
+    """Value listings at arbitrary GPS coordinates and snap them to communes.
+
+    The models are fed the given coordinates directly; each point is also
+    reverse-geocoded to its nearest commune centroid so it can be recorded
+    in the search history. Returns a dict of equal-length columns: price
+    (float64), commune and district (names) and distance_km to the centroid.
+    """
+    # scipy is only needed here, so keep it out of this module's import time.
+    from spatial_index import get_commune_index
+
+    prices = estimate_prices_batch(property_types, latitudes, longitudes, sizes, bedrooms, bathrooms)
+    communes, districts, distances = get_commune_index().reverse_geocode(latitudes, longitudes)
+    return {"price": prices, "commune": communes, "district": districts, "distance_km": distances}
 
 if __name__ == "__main__":
-    print(estimate_price(1, 11.547598, 104.917943, 120, 4, 4))
\ No newline at end of file
+    print(estimate_price(1, 11.547598, 104.917943, 120, 4, 4))
@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import os
+import threading
+import joblib
+import numpy as np
+from metrics import measure
+from tree_engine import compile_ensemble, golden_set
+
+SMOKE_ROWS = 256  # golden-set rows a new model must predict before it is swapped in
+WATCH_INTERVAL = 2.0  # seconds between checks of the model files
+
+logger = logging.getLogger(__name__)
+
+class ModelValidationError(ValueError):
+    """Raised when a model file fails the smoke test."""
+
+def file_version(path):
+    """Return the SHA-256 of a model file, which identifies its version."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+class LoadedModel:
+    """One version of a model file: the sklearn model, its compiled copy and where it came from."""
+
+    __slots__ = ('model', 'compiled', 'version', 'stamp', 'path')
+
+    def __init__(self, model, compiled, version, stamp, path):
+        self.model = model
+        self.compiled = compiled
+        self.version = version
+        self.stamp = stamp  # (mtime_ns, size) of the file when it was read
+        self.path = path
+
+def validate_model(model, compiled, n_features, rows=SMOKE_ROWS):
+    """Raise ModelValidationError unless the model passes the smoke set.
+
+    The model must take `n_features` columns, predict finite prices for
+    golden-set rows, and its compiled copy must agree with predict exactly.
+    """
+    if getattr(model, 'n_features_in_', n_features) != n_features:
+        raise ModelValidationError(f"expects {model.n_features_in_} features, not {n_features}")
+    X = golden_set(n_features, rows)
+    expected = model.predict(X)
+    if not np.all(np.isfinite(expected)):
+        raise ModelValidationError("predicts non-finite prices")
+    if not np.array_equal(compiled.predict(X), expected):
+        raise ModelValidationError("compiled ensemble disagrees with predict")
+
+def load_model(path, n_features):
+    """Load, compile and validate a model file, returning a LoadedModel."""
+    stamp = _file_stamp(path)
+    version = file_version(path)
+    model = joblib.load(path)
+    if _file_stamp(path) != stamp:
+        raise ModelValidationError(f"{path} changed while it was loaded")
+    compiled = compile_ensemble(model)
+    validate_model(model, compiled, n_features)
+    return LoadedModel(model, compiled, version, stamp, path)
+
+class ModelRegistry:
+    """The current version of each model file, reloaded when the file changes.
+
+    get() loads a model on first use. check() (or the thread started by
+    watch()) notices files whose mtime or size changed, loads and validates
+    the new version and replaces the old one with a single assignment.
+    Callers keep the LoadedModel they fetched, so work in progress finishes
+    on the version it started with. Listeners added with add_listener are
+    called as listener(property_type, version) whenever a version changes.
+    """
+
+    def __init__(self, files, n_features):
+        self.files = dict(files)
+        self.n_features = dict(n_features)
+        # Hashing is cheap next to unpickling, so versions are known before any model is loaded.
+        self.versions = {property_type: file_version(path) for property_type, path in self.files.items()}
+        self._stamps = {property_type: _file_stamp(path) for property_type, path in self.files.items()}
+        self._models = {}
+        self._rejected = {}  # property_type -> stamp of a file that failed validation
+        self._locks = {property_type: threading.Lock() for property_type in self.files}
+        self._listeners = []
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def get(self, property_type):
+        """Return the LoadedModel for a type, loading it on first use.
+
+        Safe to call from several threads; later callers wait for a load in
+        progress, which is how a search made during warm-up waits for its model.
+        """
+        loaded = self._models.get(property_type)
+        if loaded is None:
+            with self._locks[property_type]:
+                loaded = self._models.get(property_type)
+                if loaded is None:
+                    with measure(f"model.load.{property_type}"):
+                        loaded = load_model(self.files[property_type], self.n_features[property_type])
+                    self._install(property_type, loaded)
+        return loaded
+
+    def is_loaded(self, property_type):
+        return property_type in self._models
+
+    def check(self):
+        """Reload every model whose file changed; return the types swapped."""
+        swapped = []
+        for property_type, path in self.files.items():
+            try:
+                stamp = _file_stamp(path)
+            except OSError:
+                continue  # mid-replace; try again next time
+            if stamp == self._stamps[property_type] or stamp == self._rejected.get(property_type):
+                continue
+            if self.reload(property_type):
+                swapped.append(property_type)
+        return swapped
+
+    def reload(self, property_type):
+        """Load the file of a type again and swap it in if it validates.
+
+        Returns True if a new version is now in use. A file that fails is
+        logged and skipped until it changes again; the old version stays.
+        """
+        path = self.files[property_type]
+        with self._locks[property_type]:
+            if not self.is_loaded(property_type):
+                # Nothing to swap; just note the version so caches drop stale entries.
+                stamp, version = _file_stamp(path), file_version(path)
+                self._stamps[property_type] = stamp
+                self._set_version(property_type, version)
+                return False
+            stamp = _file_stamp(path)
+            try:
+                with measure(f"model.reload.{property_type}"):
+                    loaded = load_model(path, self.n_features[property_type])
+            except Exception:
+                # A file still being written gets a new stamp and is retried.
+                self._rejected[property_type] = stamp
+                logger.exception("Keeping the current %s; its replacement failed to load", path)
+                return False
+            old_version = self._models[property_type].version
+            self._install(property_type, loaded)
+            if loaded.version != old_version:
+                logger.info("Swapped in %s version %s", path, loaded.version[:12])
+            return loaded.version != old_version
+
+    def _install(self, property_type, loaded):
+        self._models[property_type] = loaded
+        self._stamps[property_type] = loaded.stamp
+        self._rejected.pop(property_type, None)
+        self._set_version(property_type, loaded.version)
+
+    def _set_version(self, property_type, version):
+        if self.versions.get(property_type) == version:
+            return
+        self.versions[property_type] = version
+        for listener in self._listeners:
+            # The model is already in use; a failing listener must not make the load look failed.
+            try:
+                listener(property_type, version)
+            except Exception:
+                logger.exception("Model version listener failed")
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Check the model files every `interval` seconds on a daemon thread."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Model file check failed")
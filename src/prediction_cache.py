@@ -0,0 +1,170 @@
+import atexit
+import sqlite3
+import threading
+from collections import OrderedDict
+
+PREDICTION_CACHE_DB = "prediction_cache.db"
+COMMIT_ROWS = 64  # most stored prices waiting for a commit
+COMMIT_DELAY = 1.0  # seconds a stored price waits for others to commit with
+
+def _whole(value, name):
+    """Return `value` as an int, raising ValueError unless it is a whole number."""
+    number = float(value or 0)
+    if not number.is_integer():
+        raise ValueError(f"{name} must be a whole number, not {value!r}")
+    return int(number)
+
+class PredictionCache:
+    """LRU cache of raw model prices with an optional SQLite second tier.
+
+    Keys are normalized feature tuples
+    (property_type, latitude, longitude, size, bedrooms, bathrooms).
+    `model_versions` maps each property type to the identity of the model
+    file its prices came from; changing a version drops that type's entries
+    from both tiers, so a retrained model never serves stale prices.
+    New prices reach the SQLite tier in batches: a commit waits for
+    COMMIT_ROWS of them or COMMIT_DELAY seconds, so a preview per keystroke
+    does not cost an fsync each.
+    """
+
+    def __init__(self, model_versions, max_size=1024, db_path=None):
+        self.model_versions = dict(model_versions)
+        self.max_size = max_size
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending = 0
+        self._commit_timer = None
+        atexit.register(self.flush)
+        if db_path:
+            self.attach_database(db_path)
+
+    @staticmethod
+    def key(property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value):
+        """Return the normalized cache key for one estimate_price call.
+
+        Raises ValueError for a fractional property type or house room count.
+        """
+        property_type = _whole(property_type, "Property type")
+        if property_type == 1:
+            bedrooms_value = _whole(bedrooms_value, "Bedrooms")
+            bathrooms_value = _whole(bathrooms_value, "Bathrooms")
+        else:
+            # Only the house model looks at room counts.
+            bedrooms_value, bathrooms_value = 0, 0
+        return (property_type, float(latitude), float(longitude), float(size_value), bedrooms_value, bathrooms_value)
+
+    def attach_database(self, db_path=PREDICTION_CACHE_DB):
+        """Back the in-memory cache with a SQLite file that survives restarts."""
+        with self._lock:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS predictions (
+                    property_type INTEGER,
+                    latitude REAL,
+                    longitude REAL,
+                    size REAL,
+                    bedrooms INTEGER,
+                    bathrooms INTEGER,
+                    model_version TEXT,
+                    price REAL,
+                    PRIMARY KEY (property_type, latitude, longitude, size, bedrooms, bathrooms)
+                )
+            ''')
+            for property_type, version in self.model_versions.items():
+                conn.execute('DELETE FROM predictions WHERE property_type = ? AND model_version != ?',
+                             (property_type, version))
+            conn.commit()
+            self._conn = conn
+
+    def get(self, key):
+        """Return the cached price for `key`, or None on a miss."""
+        with self._lock:
+            price = self._entries.get(key)
+            if price is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return price
+            if self._conn is not None:
+                row = self._conn.execute('''
+                    SELECT price FROM predictions
+                    WHERE property_type = ? AND latitude = ? AND longitude = ? AND size = ?
+                      AND bedrooms = ? AND bathrooms = ?
+                ''', key).fetchone()
+                if row is not None:
+                    self.persistent_hits += 1
+                    self._remember(key, row[0])
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, price):
+        """Store a freshly computed price in both tiers."""
+        price = float(price)
+        with self._lock:
+            self._remember(key, price)
+            if self._conn is not None:
+                self._conn.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   key + (self.model_versions[key[0]], price))
+                self._pending += 1
+                if self._pending >= COMMIT_ROWS:
+                    self._commit()
+                elif self._commit_timer is None:
+                    self._commit_timer = threading.Timer(COMMIT_DELAY, self.flush)
+                    self._commit_timer.daemon = True
+                    self._commit_timer.start()
+
+    def flush(self):
+        """Commit the prices stored since the last commit."""
+        with self._lock:
+            self._commit()
+
+    def set_model_version(self, property_type, version):
+        """Invalidate every entry of `property_type` when its model changes."""
+        with self._lock:
+            if self.model_versions.get(property_type) == version:
+                return
+            self.model_versions[property_type] = version
+            for key in [key for key in self._entries if key[0] == property_type]:
+                del self._entries[key]
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM predictions WHERE property_type = ?', (property_type,))
+                self._commit()
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.persistent_hits = self.misses = 0
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM predictions')
+                self._commit()
+
+    def stats(self):
+        """Return the hit/miss counters and current size."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+            }
+
+    def _commit(self):
+        # Called with self._lock held.
+        if self._commit_timer is not None:
+            self._commit_timer.cancel()
+            self._commit_timer = None
+        if self._conn is not None:
+            self._conn.commit()
+        self._pending = 0
+
+    def _remember(self, key, price):
+        self._entries[key] = price
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from gazetteer import get_gazetteer
+
+TILES_DIR = 'model/tiles'
+MANIFEST_NAME = 'manifest.json'
+TILE_FILES = {1: 'house.npy', 2: 'condo.npy', 3: 'land.npy'}
+
+# Grid swept for each property type: (sizes, bedrooms, bathrooms). Only the
+# house model uses room counts, so the other types have a single 0 entry.
+GRIDS = {
+    1: (np.arange(20, 1001, 10), np.arange(0, 9), np.arange(0, 9)),
+    2: (np.arange(20, 501, 5), np.arange(0, 1), np.arange(0, 1)),
+    3: (np.arange(50, 5001, 50), np.arange(0, 1), np.arange(0, 1)),
+}
+BATCH_ROWS = 65536  # rows scored per estimate_prices_batch call while building
+
+class TileStore:
+    """Memory-mapped price grids written by build_tiles.
+
+    Each tile is a float64 array indexed by
+    (commune row, size step, bedrooms step, bathrooms step).
+    """
+
+    def __init__(self, manifest, tiles, coordinates):
+        self.manifest = manifest
+        self.tiles = tiles
+        self.grids = {int(property_type): tuple(np.asarray(axis) for axis in axes)
+                      for property_type, axes in manifest['grids'].items()}
+        self._row_by_coordinates = {(lat, lon): row for row, (lat, lon) in enumerate(coordinates)}
+
+    @classmethod
+    def open(cls, directory=TILES_DIR, model_versions=None):
+        """Open the tiles in `directory`, or return None if they are missing or stale.
+
+        Tiles are stale when `model_versions` (property type -> model hash)
+        differs from the hashes recorded in the manifest when they were built.
+        """
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if model_versions is not None:
+            built_with = {int(property_type): version for property_type, version in manifest['model_versions'].items()}
+            if built_with != dict(model_versions):
+                return None
+        tiles = {int(property_type): np.load(os.path.join(directory, name), mmap_mode='r')
+                 for property_type, name in manifest['files'].items()}
+        coordinates = [tuple(point) for point in manifest['coordinates']]
+        return cls(manifest, tiles, coordinates)
+
+    def lookup(self, property_type, latitude, longitude, size_value, bedrooms_value=0, bathrooms_value=0,
+               interpolate=True):
+        """Return a price from the tiles, or None if the query is off the grid.
+
+        The coordinates must be a commune centroid and the room counts grid
+        values. Sizes between grid steps are linearly interpolated when
+        `interpolate` is set; otherwise only exact grid sizes are answered.
+        """
+        row = self._row_by_coordinates.get((latitude, longitude))
+        grid = self.grids.get(property_type)
+        if row is None or grid is None:
+            return None
+        sizes, bedrooms, bathrooms = grid
+        if property_type != 1:
+            bedrooms_value = bathrooms_value = 0
+        bedroom_step = _grid_step(bedrooms, bedrooms_value)
+        bathroom_step = _grid_step(bathrooms, bathrooms_value)
+        if bedroom_step is None or bathroom_step is None:
+            return None
+
+        prices = self.tiles[property_type][row, :, bedroom_step, bathroom_step]
+        size_step = _grid_step(sizes, size_value)
+        if size_step is not None:
+            return float(prices[size_step])
+        if not interpolate or not sizes[0] < size_value < sizes[-1]:
+            return None
+        upper = int(np.searchsorted(sizes, size_value))
+        lower = upper - 1
+        weight = (size_value - sizes[lower]) / (sizes[upper] - sizes[lower])
+        return float(prices[lower] + weight * (prices[upper] - prices[lower]))
+
+def _grid_step(axis, value):
+    """Return the index of `value` in a sorted grid axis, or None."""
+    step = int(np.searchsorted(axis, value))
+    if step < len(axis) and axis[step] == value:
+        return step
+    return None
+
+def build_tiles(directory=TILES_DIR, verbose=True):
+    """Sweep every commune over GRIDS through the models and write the tiles."""
+    from model import MODEL_VERSIONS, estimate_prices_batch
+
+    gazetteer = get_gazetteer()
+    coordinates = gazetteer.coordinates
+    os.makedirs(directory, exist_ok=True)
+    # Readers ignore tiles without a manifest, so drop it while rebuilding.
+    if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+        os.remove(os.path.join(directory, MANIFEST_NAME))
+    for property_type, (sizes, bedrooms, bathrooms) in GRIDS.items():
+        start = time.perf_counter()
+        shape = (len(coordinates), len(sizes), len(bedrooms), len(bathrooms))
+        path = os.path.join(directory, TILE_FILES[property_type])
+        tile = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float64, shape=shape)
+
+        # Grid points in C order of the tile, scored in bounded batches.
+        communes, size_steps, bedroom_steps, bathroom_steps = np.unravel_index(np.arange(tile.size), shape)
+        flat = tile.reshape(-1)
+        for begin in range(0, tile.size, BATCH_ROWS):
+            rows = slice(begin, begin + BATCH_ROWS)
+            count = len(flat[rows])
+            flat[rows] = estimate_prices_batch(
+                np.full(count, property_type),
+                coordinates[communes[rows], 0], coordinates[communes[rows], 1],
+                sizes[size_steps[rows]], bedrooms[bedroom_steps[rows]], bathrooms[bathroom_steps[rows]])
+        tile.flush()
+        del tile, flat
+        os.replace(path + '.tmp', path)
+        if verbose:
+            elapsed = time.perf_counter() - start
+            print(f"{TILE_FILES[property_type]}: {np.prod(shape):,} prices in {elapsed:.1f}s")
+
+    manifest = {
+        'model_versions': {str(property_type): version for property_type, version in MODEL_VERSIONS.items()},
+        'files': {str(property_type): name for property_type, name in TILE_FILES.items()},
+        'grids': {str(property_type): [axis.tolist() for axis in axes] for property_type, axes in GRIDS.items()},
+        'coordinates': coordinates.tolist(),
+        'communes': [[commune['district_slug'], commune['en_name']] for commune in gazetteer.communes],
+    }
+    # Write the manifest last so readers never see it next to half-built tiles.
+    with open(os.path.join(directory, MANIFEST_NAME + '.tmp'), 'w') as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(directory, MANIFEST_NAME + '.tmp'), os.path.join(directory, MANIFEST_NAME))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute price tiles for every commune.")
+    parser.add_argument('--output', default=TILES_DIR, help="directory to write the tiles and manifest to")
+    args = parser.parse_args()
+    build_tiles(args.output)
@@ -0,0 +1,119 @@
+import argparse
+import os
+import threading
+from PyQt6.QtCore import QRunnable, QThreadPool, Qt
+from PyQt6.QtGui import QImage, QPixmap, QPixmapCache
+
+RESOURCE_DIR = 'resource'
+BUILD_DIR = 'resource/build'
+CACHE_LIMIT_KB = 32 * 1024
+LOGO_SIZE = 193
+
+# (file, bounding size or None for full size) loaded at startup and emitted by --build.
+PRELOAD = [('background.png', None), ('logo.png', LOGO_SIZE)]
+
+_decoded = {}  # (file, size) -> QImage decoded off the GUI thread, not yet a QPixmap
+_decode_locks = {}  # (file, size) -> lock held while that image is decoded
+_lock = threading.Lock()
+
+def _variant_stem(name, size):
+    stem = os.path.splitext(name)[0]
+    return os.path.join(BUILD_DIR, f"{stem}_{size or 'full'}")
+
+def decode_image(name, size=None):
+    """Decode a resource image, scaled to fit size x size if given.
+
+    Prefers a variant written by the build step. Works from any thread,
+    unlike QPixmap, so it is what the background preloader calls.
+    """
+    key = (name, size)
+    with _lock:
+        key_lock = _decode_locks.setdefault(key, threading.Lock())
+    # A second caller waits for a decode already in flight instead of repeating it.
+    with key_lock:
+        with _lock:
+            image = _decoded.get(key)
+        if image is not None:
+            return image
+
+        image = None
+        for extension in ('.jpg', '.png'):
+            path = _variant_stem(name, size) + extension
+            if os.path.exists(path):
+                image = QImage(path)
+                break
+        if image is None:
+            image = QImage(os.path.join(RESOURCE_DIR, name))
+            if size and not image.isNull():
+                image = image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+        # The premultiplied format is what the raster paint engine draws fastest.
+        image = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+        with _lock:
+            _decoded[key] = image
+        return image
+
+def pixmap(name, size=None):
+    """Return the shared QPixmap for a resource image (GUI thread only)."""
+    key = f"{name}@{size or 'full'}"
+    cached = QPixmapCache.find(key)
+    if cached is not None and not cached.isNull():
+        return cached
+    image = decode_image(name, size)
+    with _lock:
+        # From here on QPixmapCache owns the image data.
+        _decoded.pop((name, size), None)
+    result = QPixmap.fromImage(image)
+    QPixmapCache.insert(key, result)
+    return result
+
+def logo_pixmap():
+    """Return the logo scaled to LOGO_SIZE, as every window shows it."""
+    return pixmap('logo.png', LOGO_SIZE)
+
+def background_pixmap():
+    """Return the full-size window background."""
+    return pixmap('background.png')
+
+class _Preloader(QRunnable):
+    def run(self):
+        for name, size in PRELOAD:
+            decode_image(name, size)
+
+def preload():
+    """Set the pixmap cache budget and decode the PRELOAD images in the background."""
+    QPixmapCache.setCacheLimit(CACHE_LIMIT_KB)
+    QThreadPool.globalInstance().start(_Preloader())
+
+def build_variants():
+    """Write pre-scaled variants of PRELOAD into BUILD_DIR.
+
+    Opaque images are re-encoded as JPEG, which decodes much faster than
+    the original PNG; images with transparency stay PNG.
+    """
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    for name, size in PRELOAD:
+        image = QImage(os.path.join(RESOURCE_DIR, name))
+        if size:
+            image = image.scaled(size, size, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        stem = _variant_stem(name, size)
+        opaque = image.convertToFormat(QImage.Format.Format_RGB32)
+        if opaque.convertToFormat(image.format()) == image:
+            path = stem + '.jpg'
+            saved = opaque.save(path, 'JPG', 90)
+        else:
+            path = stem + '.png'
+            saved = image.save(path, 'PNG', 0)
+        print(f"{path}: {'written' if saved else 'FAILED'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emit pre-scaled image variants for faster startup.")
+    parser.add_argument('--build', action='store_true', help=f"write the variants to {BUILD_DIR}")
+    args = parser.parse_args()
+    if args.build:
+        from PyQt6.QtGui import QGuiApplication
+        app = QGuiApplication([])
+        build_variants()
+    else:
+        parser.print_help()
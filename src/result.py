@@ -1,22 +1,43 @@
 
-from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel
-from PyQt6.QtGui import QPixmap, QPalette, QBrush, QFont
-from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView
+from PyQt6.QtGui import QPalette, QBrush, QFont
+from PyQt6.QtCore import Qt, QCoreApplication, QThreadPool
+from curve_chart import CurveChart
+from gazetteer import get_gazetteer
+from metrics import timed
+from model import format_price
+from resources import background_pixmap, logo_pixmap
+from sensitivity import surface_cache
+from validation import PROPERTY_TYPES
+from workers import ComparablesWorker, SurfaceWorker
+
+SIZE_WINDOW = (0.5, 2.0)  # size curve range, as fractions of the entered size
+COMPARABLES_COLUMNS = ["District", "Commune", "Size", "Bedrooms", "Bathrooms", "Price"]
 
 class ResultWindow(QWidget):
-    def __init__(self, property_type, district, commune, price, size_value, bedrooms_value, bathrooms_value):
+    """Shows one estimate; reuse it with update_result() rather than building another."""
+
+    def __init__(self, property_type, district, commune, price, size_value, bedrooms_value, bathrooms_value,
+                 search_id=None):
         super().__init__()
-        self.initUI(property_type, district, commune, price, size_value, bedrooms_value, bathrooms_value)
+        # Bumped per result; what-if curves and comparables for an older result are dropped.
+        self.curves_generation = 0
+        self.comparables_generation = 0
+        # Workers started for this window; cancelled on close and waited for at exit.
+        self.workers = []
+        QCoreApplication.instance().aboutToQuit.connect(self.stop_workers)
+        self.initUI()
+        self.update_result(property_type, district, commune, price, size_value, bedrooms_value, bathrooms_value,
+                           search_id)
     
-    def initUI(self, property_type, district, commune, price, size_value, bedrooms_value, bathrooms_value):
+    @timed("ResultWindow.initUI")
+    def initUI(self):
         layout = QVBoxLayout()
         layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
         
         logo_label = QLabel(self)
         try:
-            logo_pixmap = QPixmap("resource/logo.png")
-            logo_pixmap = logo_pixmap.scaled(193, 193, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            logo_label.setPixmap(logo_pixmap)
+            logo_label.setPixmap(logo_pixmap())
         except Exception as e:
             logo_label.setText("Logo not found")
         logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -34,38 +55,47 @@ class ResultWindow(QWidget):
         font = QFont('Arial', 18)
 
         # Estimated Price
-        estimate_price_label = QLabel(f"Estimated Price: {price}")
-        estimate_price_label.setFont(QFont('Arial', 24))
-        estimate_price_label.setMargin(20)
-        estimate_price_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        layout.addWidget(estimate_price_label)
-        
-        # Display the property details
-        property_type_label = QLabel(f"Property Type: {property_type}")
-        property_type_label.setFont(font)
-        layout.addWidget(property_type_label)
-        
-        district_label = QLabel(f"District: {district}")
-        district_label.setFont(font)
-        layout.addWidget(district_label)
+        self.estimate_price_label = QLabel()
+        self.estimate_price_label.setFont(QFont('Arial', 24))
+        self.estimate_price_label.setMargin(20)
+        self.estimate_price_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.estimate_price_label)
         
-        commune_label = QLabel(f"Commune: {commune}")
-        commune_label.setFont(font)
-        layout.addWidget(commune_label)
-        
-        size_label = QLabel(f"Land/House size: {size_value} sqm")
-        size_label.setFont(font)
-        layout.addWidget(size_label)
-        
-        # Only add bedroom & bathroom labels if it's a House
-        if property_type == "House":
-            bedrooms_label = QLabel(f"Number of bedrooms: {bedrooms_value}")
-            bedrooms_label.setFont(font)
-            layout.addWidget(bedrooms_label)
+        # Property details, filled in by update_result
+        self.property_type_label = QLabel()
+        self.district_label = QLabel()
+        self.commune_label = QLabel()
+        self.size_label = QLabel()
+        self.bedrooms_label = QLabel()
+        self.bathrooms_label = QLabel()
+        for label in (self.property_type_label, self.district_label, self.commune_label,
+                      self.size_label, self.bedrooms_label, self.bathrooms_label):
+            label.setFont(font)
+            layout.addWidget(label)
 
-            bathrooms_label = QLabel(f"Number of bathrooms: {bathrooms_value}")
-            bathrooms_label.setFont(font)
-            layout.addWidget(bathrooms_label)
+        # What-if curves around the entered values
+        layout.addSpacing(16)
+        curves_layout = QHBoxLayout()
+        self.size_chart = CurveChart("Price vs size (sqm)")
+        self.bedrooms_chart = CurveChart("Price vs bedrooms")
+        self.bathrooms_chart = CurveChart("Price vs bathrooms")
+        for chart in (self.size_chart, self.bedrooms_chart, self.bathrooms_chart):
+            curves_layout.addWidget(chart)
+        layout.addLayout(curves_layout)
+
+        # Most similar past searches
+        layout.addSpacing(16)
+        self.comparables_label = QLabel("Similar past searches")
+        self.comparables_label.setFont(font)
+        layout.addWidget(self.comparables_label)
+        self.comparables_table = QTableWidget(0, len(COMPARABLES_COLUMNS))
+        self.comparables_table.setHorizontalHeaderLabels(COMPARABLES_COLUMNS)
+        self.comparables_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.comparables_table.setSelectionMode(QTableWidget.SelectionMode.NoSelection)
+        self.comparables_table.verticalHeader().hide()
+        self.comparables_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.comparables_table.setStyleSheet(self.table_style())
+        layout.addWidget(self.comparables_table)
 
         self.setLayout(layout)
         self.setGeometry(100, 100, 800, 1000)
@@ -73,8 +103,147 @@ class ResultWindow(QWidget):
         # Background
         palette = QPalette()
         try:
-            pixmap = QPixmap("resource/background.png") 
-            palette.setBrush(QPalette.ColorRole.Window, QBrush(pixmap))
+            palette.setBrush(QPalette.ColorRole.Window, QBrush(background_pixmap()))
         except Exception as e:
             palette.setColor(QPalette.ColorRole.Window, Qt.GlobalColor.white)
         self.setPalette(palette)
+
+    @timed("ResultWindow.update_result")
+    def update_result(self, property_type, district, commune, price, size_value, bedrooms_value, bathrooms_value,
+                      search_id=None):
+        """Show another estimate in this window, rewriting only the label text.
+
+        `search_id` is the estimate's id in the search history, if it was saved.
+        """
+        self.estimate_price_label.setText(f"Estimated Price: {price}")
+        self.property_type_label.setText(f"Property Type: {property_type}")
+        self.district_label.setText(f"District: {district}")
+        self.commune_label.setText(f"Commune: {commune}")
+        self.size_label.setText(f"Land/House size: {size_value} sqm")
+        self.bedrooms_label.setText(f"Number of bedrooms: {bedrooms_value}")
+        self.bathrooms_label.setText(f"Number of bathrooms: {bathrooms_value}")
+
+        # Only show bedroom & bathroom labels if it's a House
+        is_house = property_type == "House"
+        self.bedrooms_label.setVisible(is_house)
+        self.bathrooms_label.setVisible(is_house)
+        self.bedrooms_chart.setVisible(is_house)
+        self.bathrooms_chart.setVisible(is_house)
+        self.update_curves(property_type, district, commune, size_value, bedrooms_value, bathrooms_value)
+        self.update_comparables(property_type, district, commune, size_value, bedrooms_value, bathrooms_value,
+                                search_id)
+
+    def update_curves(self, property_type, district, commune, size_value, bedrooms_value, bathrooms_value):
+        """Draw the what-if curves, from the cache or once a SurfaceWorker is done."""
+        self.curves_generation += 1
+        property_type_id = PROPERTY_TYPES.get(property_type)
+        coordinates = get_gazetteer().commune_coordinates(commune, district)
+        if property_type_id is None or coordinates is None:
+            for chart in (self.size_chart, self.bedrooms_chart, self.bathrooms_chart):
+                chart.set_message("Not available")
+            return
+        self.entered = (float(size_value), int(bedrooms_value or 0), int(bathrooms_value or 0))
+        args = (property_type_id, *coordinates, *self.entered)
+        surface = surface_cache.get(*args)
+        if surface is not None:
+            self.draw_curves(surface)
+            return
+        for chart in (self.size_chart, self.bedrooms_chart, self.bathrooms_chart):
+            chart.set_message("Calculating...")
+        worker = SurfaceWorker(self.curves_generation, *args)
+        worker.signals.finished.connect(self.on_surface_ready)
+        worker.signals.failed.connect(self.on_surface_failed)
+        self.start_worker(worker)
+
+    def on_surface_ready(self, generation, surface):
+        if generation == self.curves_generation:
+            self.draw_curves(surface)
+
+    def on_surface_failed(self, generation, details):
+        if generation == self.curves_generation:
+            for chart in (self.size_chart, self.bedrooms_chart, self.bathrooms_chart):
+                chart.set_message("Could not calculate")
+
+    def draw_curves(self, surface):
+        size_value, bedrooms_value, bathrooms_value = self.entered
+        sizes, prices = surface.size_curve(bedrooms_value, bathrooms_value)
+        # Zoom in on half to double the entered size
+        around = (sizes >= size_value * SIZE_WINDOW[0]) & (sizes <= size_value * SIZE_WINDOW[1])
+        if around.sum() >= 2:
+            sizes, prices = sizes[around], prices[around]
+        self.size_chart.set_curve(sizes, prices, marker=size_value)
+        self.bedrooms_chart.set_curve(*surface.bedrooms_curve(size_value, bathrooms_value), marker=bedrooms_value)
+        self.bathrooms_chart.set_curve(*surface.bathrooms_curve(size_value, bedrooms_value), marker=bathrooms_value)
+
+    def update_comparables(self, property_type, district, commune, size_value, bedrooms_value, bathrooms_value,
+                           search_id=None):
+        """List the most similar past searches once a ComparablesWorker finds them."""
+        self.comparables_generation += 1
+        self.comparables_label.setText("Similar past searches: searching...")
+        self.comparables_table.setColumnHidden(3, property_type != "House")
+        self.comparables_table.setColumnHidden(4, property_type != "House")
+        worker = ComparablesWorker(self.comparables_generation, property_type, district, commune,
+                                   size_value, bedrooms_value, bathrooms_value, search_id)
+        worker.signals.finished.connect(self.on_comparables_ready)
+        worker.signals.failed.connect(self.on_comparables_failed)
+        self.start_worker(worker)
+
+    def on_comparables_ready(self, generation, rows):
+        if generation != self.comparables_generation:
+            return
+        self.comparables_label.setText("Similar past searches" if rows else "Similar past searches: none yet")
+        self.comparables_table.setRowCount(len(rows))
+        for row, (_, _, district, commune, price, size, bedrooms, bathrooms) in enumerate(rows):
+            values = (district, commune, f"{size:g} sqm" if size is not None else "", bedrooms, bathrooms,
+                      format_price(price) if price is not None else "")
+            for column, value in enumerate(values):
+                self.comparables_table.setItem(row, column, QTableWidgetItem("" if value is None else str(value)))
+
+    def on_comparables_failed(self, generation, details):
+        if generation == self.comparables_generation:
+            self.comparables_label.setText("Similar past searches: not available")
+            self.comparables_table.setRowCount(0)
+
+    def start_worker(self, worker):
+        self.workers = [running for running in self.workers if not running.done]
+        self.workers.append(worker)
+        QThreadPool.globalInstance().start(worker)
+
+    def cancel_workers(self):
+        """Stop the running workers from reporting back; update_result starts new ones."""
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def stop_workers(self):
+        """Cancel the workers and wait for the pool, so none outlives the app's objects."""
+        self.cancel_workers()
+        QThreadPool.globalInstance().waitForDone()
+
+    def closeEvent(self, event):
+        self.cancel_workers()
+        super().closeEvent(event)
+
+    def table_style(self):
+        return """
+            QTableWidget {
+                background-color: #2C2F33;
+                color: #FFFFFF;
+                font-size: 14px;
+                border-radius: 10px;
+                gridline-color: #444;
+            }
+            QHeaderView::section {
+                background-color: #23272A;
+                color: #FFFFFF;
+                font-weight: bold;
+                padding: 6px;
+                border: none;
+            }
+        """
+
+    def present(self):
+        """Show the window, or bring it to the front if it is already open."""
+        self.show()
+        self.raise_()
+        self.activateWindow()
@@ -0,0 +1,162 @@
+"""Price every stored search again with the current models.
+
+Run from the repository root after deploying retrained models:
+
+    python src/revalue_history.py
+    python src/revalue_history.py --database other.db --chunk-rows 50000
+
+Searches are read in id order, --chunk-rows at a time, and each chunk is
+priced with one estimate_prices_batch call, which makes one predict call
+per property type. New prices are written with executemany, in
+transactions of at most --transaction-rows rows. Each row records the
+model version that produced its price.
+
+The last transaction of a chunk also stores how far the job got, so an
+interrupted run resumes where it stopped. Searches already priced by the
+current version are skipped. Reads take no lock under WAL, and each write
+transaction is short, so the app keeps saving searches meanwhile. The
+daily summary is rebuilt at the end; the checkpoint notes that it is stale
+until then, so a run that dies before the rebuild leaves it to the next.
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import search_database
+from gazetteer import get_gazetteer
+from metrics import measure
+from model import MODEL_FILES, MODEL_VERSIONS, estimate_prices_batch, warm_up
+from search_database import create_database, get_connection, rebuild_search_summary
+from validation import PROPERTY_TYPES
+
+CHUNK_ROWS = 20_000  # searches read and priced at a time
+TRANSACTION_ROWS = 5_000  # most prices written per transaction, so the app's writer never waits long
+PROGRESS_INTERVAL = 5.0  # seconds between progress lines
+
+class ModelsChangedError(RuntimeError):
+    """Raised when a model file is swapped while the job runs."""
+
+def _target(versions):
+    """Return the checkpoint key for a set of model versions."""
+    return ",".join(f"{property_type}:{versions[property_type]}" for property_type in sorted(versions))
+
+def _price_chunk(rows, versions, coordinates):
+    """Return (price, model version, id) UPDATE parameters for the stale searches in `rows`.
+
+    Searches already priced by `versions`, or with an unknown type or
+    commune, or no size, are left out.
+    """
+    ids, types, latitudes, longitudes, sizes, bedrooms, bathrooms = [], [], [], [], [], [], []
+    for search_id, property_type, district, commune, size, bedroom_count, bathroom_count, model_version in rows:
+        property_type_id = PROPERTY_TYPES.get(property_type)
+        if property_type_id is None or size is None or model_version == versions[property_type_id]:
+            continue
+        key = (commune, district)
+        if key not in coordinates:
+            coordinates[key] = get_gazetteer().commune_coordinates(commune, district)
+        if coordinates[key] is None:
+            continue
+        ids.append(search_id)
+        types.append(property_type_id)
+        latitudes.append(coordinates[key][0])
+        longitudes.append(coordinates[key][1])
+        sizes.append(size)
+        bedrooms.append(bedroom_count or 0)
+        bathrooms.append(bathroom_count or 0)
+    if not ids:
+        return []
+    prices = estimate_prices_batch(np.array(types), np.array(latitudes), np.array(longitudes),
+                                   np.array(sizes, dtype=np.float64), np.array(bedrooms), np.array(bathrooms))
+    return [(price, versions[property_type_id], search_id)
+            for price, property_type_id, search_id in zip(prices.tolist(), types, ids)]
+
+def revalue_searches(chunk_rows=CHUNK_ROWS, transaction_rows=TRANSACTION_ROWS, restart=False, progress=None):
+    """Price stale searches with the current models; return (scanned, revalued, seconds).
+
+    `restart` ignores the checkpoint and scans from the first search.
+    `progress`, if given, is called as progress(scanned, revalued, seconds)
+    at most every PROGRESS_INTERVAL seconds. Raises ModelsChangedError,
+    with progress so far committed, if a model file changes meanwhile.
+    """
+    create_database()
+    warm_up()
+    versions = {property_type: MODEL_VERSIONS[property_type] for property_type in MODEL_FILES}
+    target = _target(versions)
+    conn = get_connection()
+    checkpoint = conn.execute('SELECT last_id FROM revaluation_checkpoint WHERE target = ?', (target,)).fetchone()
+    after = 0 if restart or checkpoint is None else checkpoint[0]
+
+    start = last_report = time.perf_counter()
+    scanned = revalued = 0
+    coordinates = {}
+    while True:
+        # Its own read transaction; under WAL it does not hold up writers.
+        rows = conn.execute('''
+            SELECT id, property_type, district, commune, size, bedrooms, bathrooms, model_version
+            FROM searches WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after, chunk_rows)).fetchall()
+        if not rows:
+            break
+        with measure("revalue_history.price_chunk"):
+            updates = _price_chunk(rows, versions, coordinates)
+        if any(MODEL_VERSIONS[property_type] != version for property_type, version in versions.items()):
+            raise ModelsChangedError("A model file changed during re-valuation; run it again")
+
+        chunk_start, after = after, rows[-1][0]
+        batches = [updates[i:i + transaction_rows] for i in range(0, len(updates), transaction_rows)] or [[]]
+        for number, batch in enumerate(batches, 1):
+            with measure("revalue_history.write_batch"), conn:
+                conn.executemany('UPDATE searches SET price = ?, model_version = ? WHERE id = ?', batch)
+                # Committed with the prices: the summary is stale until the rebuild below.
+                conn.execute('''
+                    INSERT INTO revaluation_checkpoint (target, last_id, summary_stale) VALUES (?, ?, ?)
+                    ON CONFLICT (target) DO UPDATE SET
+                        last_id = excluded.last_id,
+                        summary_stale = max(summary_stale, excluded.summary_stale)
+                ''', (target, after if number == len(batches) else chunk_start, 1 if batch else 0))
+        scanned += len(rows)
+        revalued += len(updates)
+        now = time.perf_counter()
+        if progress is not None and now - last_report >= PROGRESS_INTERVAL:
+            progress(scanned, revalued, now - start)
+            last_report = now
+
+    # Prices changed in place, by this run or by one that died before rebuilding;
+    # the insert trigger does not see updates.
+    if conn.execute('SELECT max(summary_stale) FROM revaluation_checkpoint').fetchone()[0]:
+        rebuild_search_summary()
+        with conn:
+            conn.execute('UPDATE revaluation_checkpoint SET summary_stale = 0')
+    return scanned, revalued, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Price the stored search history again with the current models.")
+    parser.add_argument("--database", default=search_database.DATABASE_NAME,
+                        help=f"history database (default {search_database.DATABASE_NAME})")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="searches read and priced at a time")
+    parser.add_argument("--transaction-rows", type=int, default=TRANSACTION_ROWS,
+                        help="most prices written per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first search")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress")
+    args = parser.parse_args()
+    search_database.DATABASE_NAME = args.database
+
+    def report(scanned, revalued, seconds):
+        print(f"{scanned:,} searches scanned, {revalued:,} re-valued in {seconds:.1f}s "
+              f"({scanned / seconds if seconds else 0:,.0f} rows/s)", file=sys.stderr)
+
+    try:
+        scanned, revalued, seconds = revalue_searches(args.chunk_rows, args.transaction_rows, args.restart,
+                                                      None if args.quiet else report)
+    except ModelsChangedError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("Interrupted; run again to resume", file=sys.stderr)
+        return 130
+    if not args.quiet:
+        report(scanned, revalued, seconds)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,230 @@
+import atexit
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from metrics import measure, timed
 
 DATABASE_NAME = "search_history.db"
+SCHEMA_VERSION = 7  # stored in PRAGMA user_version; see MIGRATIONS
 
-def create_database():
-    """Create the SQLite database and table if it doesn't exist."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
+# WAL lets readers run alongside the writer. SQLite's WAL needs shared memory,
+# so set this to "DELETE" when the database lives on a network filesystem.
+JOURNAL_MODE = "WAL"
+BUSY_TIMEOUT = 30  # seconds to wait for another process's lock
+WRITE_BATCH_SIZE = 500  # most rows inserted per transaction
+WRITE_DELAY = 0.05  # seconds the writer waits for more rows to batch
+
+# Columns the history view can sort and filter on; each has an index.
+SORTABLE_COLUMNS = ("id", "property_type", "district", "commune", "price")
+FILTERABLE_COLUMNS = ("property_type", "district", "commune")
+
+# Indexes that let get_searches_page walk pages in order without sorting,
+# for every sort column alone and combined with the history window filters.
+# Price is not indexed with a commune filter; one commune's searches sort quickly.
+SEARCH_INDEXES = {
+    "idx_searches_property_type": "property_type, id",
+    "idx_searches_district": "district, id",
+    "idx_searches_commune": "commune, id",
+    "idx_searches_type_district": "property_type, district, id",
+    "idx_searches_district_type": "district, property_type, id",
+    "idx_searches_type_commune": "property_type, commune, id",
+    "idx_searches_district_commune": "district, commune, id",
+    "idx_searches_type_district_commune": "property_type, district, commune, id",
+    "idx_searches_price": "price, id",
+    "idx_searches_type_price": "property_type, price, id",
+    "idx_searches_district_price": "district, price, id",
+    "idx_searches_type_district_price": "property_type, district, price, id",
+}
+
+# Per commune, property type and UTC day totals kept up to date by a trigger
+# on every insert, so aggregates never scan the searches table. Searches
+# saved before created_at existed are counted under the day '', and a
+# missing type, district or commune under '' too, as the key is NOT NULL.
+SUMMARY_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS searches_daily_summary AFTER INSERT ON searches
+    WHEN NEW.price IS NOT NULL
+    BEGIN
+        INSERT INTO search_daily_summary
+            (property_type, district, commune, day, count, price_sum, price_min, price_max)
+        VALUES (COALESCE(NEW.property_type, ''), COALESCE(NEW.district, ''), COALESCE(NEW.commune, ''),
+                COALESCE(date(NEW.created_at), ''), 1, NEW.price, NEW.price, NEW.price)
+        ON CONFLICT (property_type, district, commune, day) DO UPDATE SET
+            count = count + 1,
+            price_sum = price_sum + excluded.price_sum,
+            price_min = min(price_min, excluded.price_min),
+            price_max = max(price_max, excluded.price_max);
+    END
+'''
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+
+@timed("search_database.get_connection")
+def get_connection(database=None):
+    """Return this thread's long-lived connection to the history database."""
+    database = database or DATABASE_NAME
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(database)
+    if conn is None:
+        conn = sqlite3.connect(database, timeout=BUSY_TIMEOUT)
+        conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}")
+        conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        connections[database] = conn
+    return conn
+
+@timed("search_database.close_connections")
+def close_connections():
+    """Close the connections opened by the calling thread."""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+INSERT_SEARCH = '''
+    INSERT INTO searches
+        (property_type, district, commune, price, size, bedrooms, bathrooms, created_at, model_version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+class SearchWriter:
+    """Background thread that batches save_search inserts.
+
+    Rows are queued by submit() and written with executemany in one
+    transaction per batch; a row that fails is logged and skipped (see
+    _write). flush() blocks until every queued row is on disk.
+    Listeners added with add_listener are called on the writer thread as
+    listener(database, ids, rows) after each batch is committed.
+    """
+
+    _FLUSH = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def submit(self, database, row):
+        """Queue a row; return a Future of its search id, None if it could not be saved."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((database, row, future))
+        return future
+
+    def flush(self):
+        if self._thread is None:
+            return
+        self._queue.put(self._FLUSH)
+        self._queue.join()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="search-writer", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for one row, then gather more until the batch is full or stale."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_DELAY
+        while batch[-1] is not self._FLUSH and len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items_by_database = {}
+            for item in batch:
+                if item is not self._FLUSH:
+                    database, row, future = item
+                    items_by_database.setdefault(database, []).append((row, future))
+            for database, items in items_by_database.items():
+                rows = [row for row, _ in items]
+                try:
+                    ids = self._write(database, rows)
+                except sqlite3.Error:
+                    logger.exception("Failed to save %d searches to %s", len(rows), database)
+                    ids = [None] * len(rows)
+                saved = [(search_id, row) for search_id, row in zip(ids, rows) if search_id is not None]
+                if saved:
+                    for listener in self._listeners:
+                        try:
+                            listener(database, [search_id for search_id, _ in saved], [row for _, row in saved])
+                        except Exception:
+                            logger.exception("Search listener failed")
+                for (_, future), search_id in zip(items, ids):
+                    future.set_result(search_id)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, database, rows):
+        """Insert `rows` and return the id of each, None for a row that failed.
+
+        A batch that fails is retried one row at a time, so a bad row is
+        logged and skipped instead of taking the rest of the batch with it.
+        """
+        conn = get_connection(database)
+        try:
+            with measure("search_database.write_batch"), conn:
+                conn.executemany(INSERT_SEARCH, rows)
+                # The writer holds the write lock, so the batch got consecutive ids.
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            return list(range(last_id - len(rows) + 1, last_id + 1))
+        except sqlite3.Error:
+            logger.warning("Failed to save %d searches to %s at once; retrying one at a time", len(rows), database)
+        ids = []
+        with conn:
+            for row in rows:
+                try:
+                    ids.append(conn.execute(INSERT_SEARCH, row).lastrowid)
+                except sqlite3.Error:
+                    logger.exception("Failed to save search %r to %s", row, database)
+                    ids.append(None)
+        return ids
+
+_writer = SearchWriter()
+
+@timed("search_database.flush_searches")
+def flush_searches():
+    """Wait until every search queued by save_search has been written."""
+    _writer.flush()
+
+atexit.register(flush_searches)
+
+def add_save_listener(listener):
+    """Call listener(database, ids, rows) on the writer thread after searches are written.
+
+    `rows` are the inserted (property_type, district, commune, price, size,
+    bedrooms, bathrooms, created_at, model_version) tuples and `ids` their search ids. It
+    must not call anything that waits for flush_searches().
+    """
+    _writer.add_listener(listener)
+
+def parse_price(price):
+    """Return a price as a float, accepting the '$1,234' text estimate_price returns."""
+    if price is None:
+        return None
+    if isinstance(price, str):
+        return float(price.replace('$', '').replace(',', ''))
+    return float(price)
+
+def _create_searches(conn):
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS searches (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             property_type TEXT,
@@ -18,40 +236,271 @@ def create_database():
             bathrooms INTEGER
         )
     ''')
-    conn.commit()
-    conn.close()
-
-def save_search(property_type, district, commune, price, size, bedrooms, bathrooms):
-    """Save a search result to the database."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO searches (property_type, district, commune, price, size, bedrooms, bathrooms)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (property_type, district, commune, price, size, bedrooms, bathrooms))
-    conn.commit()
-    conn.close()
+    _create_search_indexes(conn)
+
+def _create_search_indexes(conn):
+    for name, columns in SEARCH_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON searches ({columns})')
+
+def _add_numeric_prices_and_summary(conn):
+    # Prices used to be saved as '$1,234' text despite the REAL column.
+    conn.execute('''
+        UPDATE searches SET price = CAST(REPLACE(REPLACE(price, '$', ''), ',', '') AS REAL)
+        WHERE typeof(price) = 'text'
+    ''')
+    conn.execute('ALTER TABLE searches ADD COLUMN created_at TEXT')
+    conn.execute('''
+        CREATE TABLE search_daily_summary (
+            property_type TEXT NOT NULL,
+            district TEXT NOT NULL,
+            commune TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            price_sum REAL NOT NULL,
+            price_min REAL NOT NULL,
+            price_max REAL NOT NULL,
+            PRIMARY KEY (property_type, district, commune, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(SUMMARY_TRIGGER)
+    _fill_search_summary(conn)
 
+def _index_created_at(conn):
+    # Lets history_transfer find an imported row's duplicates without a scan,
+    # even when many searches share a timestamp.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_searches_created_at ON searches (created_at, commune, price)')
+
+def _add_model_versions(conn):
+    # The model file version (see model.MODEL_VERSIONS) that produced each
+    # price; NULL for searches saved before it was recorded.
+    conn.execute('ALTER TABLE searches ADD COLUMN model_version TEXT')
+    # How far revalue_history got towards pricing every search with one set of model versions.
+    conn.execute('''
+        CREATE TABLE revaluation_checkpoint (
+            target TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+
+def _summarize_missing_keys(conn):
+    # The first trigger failed the insert of a priced search without a district or commune.
+    conn.execute('DROP TRIGGER IF EXISTS searches_daily_summary')
+    conn.execute(SUMMARY_TRIGGER)
+
+def _track_stale_summary(conn):
+    # Set once revalue_history changes prices and cleared after it rebuilds the
+    # summary, so a run that died in between still rebuilds it next time.
+    conn.execute('ALTER TABLE revaluation_checkpoint ADD COLUMN summary_stale INTEGER NOT NULL DEFAULT 0')
+
+# MIGRATIONS[n] upgrades a database from user_version n to n + 1.
+# _create_search_indexes adds the price indexes that older databases lack.
+MIGRATIONS = [_create_searches, _add_numeric_prices_and_summary, _index_created_at, _add_model_versions,
+              _create_search_indexes, _summarize_missing_keys, _track_stale_summary]
+
+SUMMARY_COLUMNS = "property_type, district, commune, day, count, price_sum, price_min, price_max"
+
+def _summary_select(where):
+    """Return a SELECT of search_daily_summary rows for the searches matching `where`."""
+    return f'''
+        SELECT COALESCE(property_type, ''), COALESCE(district, ''), COALESCE(commune, ''),
+               COALESCE(date(created_at), ''), COUNT(*), SUM(price), MIN(price), MAX(price)
+        FROM searches WHERE price IS NOT NULL AND {where}
+        GROUP BY 1, 2, 3, 4
+    '''
+
+def _fill_search_summary(conn):
+    conn.execute(f'INSERT INTO search_daily_summary ({SUMMARY_COLUMNS}) {_summary_select("1")}')
+
+@timed("search_database.create_database")
+def create_database():
+    """Create the SQLite database or migrate it to SCHEMA_VERSION."""
+    conn = get_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    # IMMEDIATE takes the write lock up front, so two processes never migrate at once.
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for migration in MIGRATIONS[version:SCHEMA_VERSION]:
+            migration(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+@timed("search_database.rebuild_search_summary")
+def rebuild_search_summary():
+    """Recompute search_daily_summary from the searches table.
+
+    Only needed after prices are changed in place; inserts keep it current.
+    The totals are computed from a read snapshot into a temporary table, so
+    other writers only wait while they are copied over; searches inserted
+    after the snapshot are then added on top.
+    """
+    flush_searches()
+    conn = get_connection()
+    conn.execute('DROP TABLE IF EXISTS temp.summary_rebuild')
+    conn.execute('BEGIN')
+    try:
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM searches').fetchone()[0]
+        conn.execute(f'CREATE TEMP TABLE summary_rebuild AS {_summary_select("1")}')
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM search_daily_summary')
+        conn.execute(f'INSERT INTO search_daily_summary ({SUMMARY_COLUMNS}) SELECT * FROM temp.summary_rebuild')
+        conn.execute(f'''
+            INSERT INTO search_daily_summary ({SUMMARY_COLUMNS}) {_summary_select("id > ?")}
+            ON CONFLICT (property_type, district, commune, day) DO UPDATE SET
+                count = count + excluded.count,
+                price_sum = price_sum + excluded.price_sum,
+                price_min = min(price_min, excluded.price_min),
+                price_max = max(price_max, excluded.price_max)
+        ''', (last_id,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DROP TABLE IF EXISTS temp.summary_rebuild')
+
+@timed("search_database.save_search")
+def save_search(property_type, district, commune, price, size, bedrooms, bathrooms, model_version=None):
+    """Queue a search result to be saved to the database.
+
+    `model_version` is the version of the model that estimated the price.
+    Returns a concurrent.futures.Future of the new search's id, which is
+    None if it could not be saved.
+    """
+    created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+    return _writer.submit(DATABASE_NAME, (property_type, district, commune, parse_price(price),
+                                   size, bedrooms, bathrooms, created_at, model_version))
+
+@timed("search_database.get_search_summary")
+def get_search_summary(filters=None, since=None, until=None):
+    """Return (count, average, minimum, maximum) price of the matching searches.
+
+    `filters` works as in get_searches_page; `since` and `until` are
+    inclusive 'YYYY-MM-DD' UTC days. Reads only search_daily_summary, so the
+    cost does not grow with the number of searches. The price fields are
+    None when nothing matches.
+    """
+    conditions, params = [], []
+    for column, value in (filters or {}).items():
+        if column not in FILTERABLE_COLUMNS:
+            raise ValueError(f"Cannot filter searches by {column!r}")
+        conditions.append(f"{column} = ?")
+        params.append(value)
+    if since is not None:
+        conditions.append("day >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("day <= ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    flush_searches()
+    count, total, minimum, maximum = get_connection().execute(f'''
+        SELECT COALESCE(SUM(count), 0), SUM(price_sum), MIN(price_min), MAX(price_max)
+        FROM search_daily_summary {where}
+    ''', params).fetchone()
+    return count, total / count if count else None, minimum, maximum
+
+@timed("search_database.get_recent_searches")
 def get_recent_searches():
     """Retrieve the last 10 searches from the database."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
+    flush_searches()
+    cursor = get_connection().execute('''
         SELECT id, property_type, district, commune, price, size, bedrooms, bathrooms
         FROM searches ORDER BY id DESC LIMIT 10
     ''')
-    searches = cursor.fetchall()
-    conn.close()
-    return searches
+    return cursor.fetchall()
 
+@timed("search_database.get_searches_by_ids")
+def get_searches_by_ids(search_ids):
+    """Return {id: row} for the given ids, rows laid out as in get_recent_searches."""
+    search_ids = list(search_ids)
+    if not search_ids:
+        return {}
+    cursor = get_connection().execute(f'''
+        SELECT id, property_type, district, commune, price, size, bedrooms, bathrooms
+        FROM searches WHERE id IN ({', '.join('?' * len(search_ids))})
+    ''', search_ids)
+    return {row[0]: row for row in cursor}
+
+@timed("search_database.get_searches_after")
+def get_searches_after(after_id, limit):
+    """Return up to `limit` searches with id above `after_id`, oldest first.
+
+    Unlike the other readers it does not wait for queued searches, so it is
+    safe to call from a save listener.
+    """
+    cursor = get_connection().execute('''
+        SELECT id, property_type, district, commune, price, size, bedrooms, bathrooms
+        FROM searches WHERE id > ? ORDER BY id LIMIT ?
+    ''', (after_id, limit))
+    return cursor.fetchall()
+
+@timed("search_database.get_search_by_id")
 def get_search_by_id(search_id):
     """Retrieve a specific search result by ID."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('''
+    flush_searches()
+    cursor = get_connection().execute('''
         SELECT property_type, district, commune, price, size, bedrooms, bathrooms
         FROM searches WHERE id = ?
     ''', (search_id,))
-    search = cursor.fetchone()
-    conn.close()
-    return search
+    return cursor.fetchone()
+
+@timed("search_database.get_searches_page")
+def get_searches_page(after=None, limit=100, sort_column="id", descending=True, filters=None):
+    """Retrieve one page of searches using keyset pagination.
+
+    `after` is None for the first page, otherwise the key of the last row of
+    the previous page: its id when sorting by id, else (sort value, id).
+    `filters` maps columns in FILTERABLE_COLUMNS to the value they must equal.
+    Rows have the same layout as get_recent_searches.
+    """
+    if sort_column not in SORTABLE_COLUMNS:
+        raise ValueError(f"Cannot sort searches by {sort_column!r}")
+    conditions, params = [], []
+    for column, value in (filters or {}).items():
+        if column not in FILTERABLE_COLUMNS:
+            raise ValueError(f"Cannot filter searches by {column!r}")
+        conditions.append(f"{column} = ?")
+        params.append(value)
+
+    direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+    flush_searches()
+    if sort_column == "id":
+        if after is not None:
+            conditions.append(f"id {comparison} ?")
+            params.append(after)
+        return _select_searches(conditions, params, f"id {direction}", limit)
+
+    # A row value comparison with NULL is never true, so searches without a
+    # value are paged as a run of their own: first ascending, last descending.
+    nulls = [f"{sort_column} IS NULL"], []
+    values = [f"{sort_column} IS NOT NULL"], []
+    if after is not None:
+        value, last_id = after
+        if value is None:
+            nulls = [f"{sort_column} IS NULL", f"id {comparison} ?"], [last_id]
+            values = None if descending else values
+        else:
+            values = [f"({sort_column}, id) {comparison} (?, ?)"], [value, last_id]
+            nulls = nulls if descending else None
+    runs = [(values, f"{sort_column} {direction}, id {direction}"), (nulls, f"id {direction}")]
+    rows = []
+    for run, order in runs if descending else reversed(runs):
+        if run is not None and len(rows) < limit:
+            rows += _select_searches(conditions + run[0], params + run[1], order, limit - len(rows))
+    return rows
+
+def _select_searches(conditions, params, order, limit):
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor = get_connection().execute(f'''
+        SELECT id, property_type, district, commune, price, size, bedrooms, bathrooms
+        FROM searches {where} ORDER BY {order} LIMIT ?
+    ''', params + [limit])
+    return cursor.fetchall()
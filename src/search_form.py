@@ -1,25 +1,47 @@
-import json
-from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QLineEdit, QComboBox, QProgressDialog, QMessageBox
-from PyQt6.QtGui import QPixmap, QPalette, QBrush, QFont, QIntValidator
-from PyQt6.QtCore import Qt
-from model import estimate_price
+import logging
+import time
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QLineEdit, QComboBox, QProgressDialog, QMessageBox, QCompleter
+from PyQt6.QtGui import QPalette, QBrush, QFont, QIntValidator
+from PyQt6.QtCore import Qt, QStringListModel, QThreadPool, QTimer, pyqtSlot
+from gazetteer import get_gazetteer
+from location_index import get_location_index
+from metrics import observe, timed
+from resources import background_pixmap, logo_pixmap
 from result import ResultWindow
 from search_history import SearchHistoryWindow
-from search_database import save_search
+from validation import SearchValidationError, validate_search
+from workers import PreviewWorker, ValuationWorker
+
+PREVIEW_DELAY_MS = 150  # quiet time after the last edit before a preview runs
+PREVIEW_BUDGET = 0.016  # seconds; previews slower than one 60 Hz frame are logged
+LOCATION_MATCHES = 10  # suggestions shown under the location search field
+
+logger = logging.getLogger(__name__)
 
 class PropertyPriceEstimation(QWidget):
     def __init__(self):
         super().__init__()
+        self.valuation_worker = None
+        self.loading_dialog = None
+        # Bumped on every edit; a preview result is only shown if it matches.
+        self.preview_generation = 0
+        self.preview_in_flight = False
+        self.preview_worker = None
+        self.preview_started_at = 0.0
+        self.resultWindow = None
+        self.searchHistoryWindow = None
+        self.location_matches = {}  # completer label -> Location
+        QApplication.instance().aboutToQuit.connect(self.stop_workers)
         self.load_data()
         self.initUI()
     
     def load_data(self):
-        with open('resource/district.json', 'r') as f:
-            self.district_data = json.load(f)
-        
-        with open('resource/commune.json', 'r') as f:
-            self.commune_data = json.load(f)
+        self.gazetteer = get_gazetteer()
+        self.district_data = self.gazetteer.districts
+        self.commune_data = self.gazetteer.communes
+        self.location_index = get_location_index()
 
+    @timed("PropertyPriceEstimation.initUI")
     def initUI(self):
         """Initialize the user interface."""
         layout = QVBoxLayout()
@@ -45,10 +67,24 @@ class PropertyPriceEstimation(QWidget):
         self.typeBox = self.create_combo_box(["Select type", "House", "Condo/Apartment", "Land"], self.update_fields_visibility)
         self.districtBox = self.create_district_combo_box()
         self.communeBox = self.create_commune_combo_box()
+
+        # Typeahead over every district and commune; picking one fills the boxes above
+        self.locationSearch, self.locationCompleter = self.create_location_search()
         
         # Input fields with integer validation
         self.sizeInput, self.bedroomsInput, self.bathroomsInput = self.create_input_fields()
         
+        # Live price preview, refreshed while the form is edited
+        self.previewLabel = self.create_preview_label()
+        self.previewTimer = QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(PREVIEW_DELAY_MS)
+        self.previewTimer.timeout.connect(self.start_preview)
+        for signal in (self.typeBox.currentIndexChanged, self.communeBox.currentIndexChanged,
+                       self.sizeInput.textChanged, self.bedroomsInput.textChanged,
+                       self.bathroomsInput.textChanged):
+            signal.connect(self.schedule_preview)
+
         # Search Button
         self.searchButton = self.create_search_button()
         
@@ -67,9 +103,7 @@ class PropertyPriceEstimation(QWidget):
         """Create and return the logo label."""
         logo_label = QLabel(self)
         try:
-            logo_pixmap = QPixmap("resource/logo.png")
-            logo_pixmap = logo_pixmap.scaled(193, 193, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            logo_label.setPixmap(logo_pixmap)
+            logo_label.setPixmap(logo_pixmap())
         except Exception:
             logo_label.setText("Logo not found")
         logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -138,6 +172,21 @@ class PropertyPriceEstimation(QWidget):
         self.districtBox.currentIndexChanged.connect(self.update_commune_box)
         return commune_combo_box
 
+    def create_location_search(self):
+        """Create and return the location search field and its completer."""
+        location_search = QLineEdit()
+        location_search.setPlaceholderText("Search commune or district (English or Khmer)")
+        # The index already ranks and filters, so the completer shows its matches as they are.
+        completer = QCompleter(location_search)
+        completer.setModel(QStringListModel(completer))
+        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        completer.setMaxVisibleItems(LOCATION_MATCHES)
+        completer.activated[str].connect(self.on_location_chosen)
+        location_search.setCompleter(completer)
+        location_search.textEdited.connect(self.update_location_matches)
+        return location_search, completer
+
     def create_input_fields(self):
         """Create and return input fields for size, bedrooms, and bathrooms."""
         int_validator = QIntValidator()
@@ -156,6 +205,13 @@ class PropertyPriceEstimation(QWidget):
 
         return size_input, bedrooms_input, bathrooms_input
 
+    def create_preview_label(self):
+        """Create and return the label showing the live price preview."""
+        preview_label = QLabel()
+        preview_label.setFont(QFont('Arial', 18))
+        preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        return preview_label
+
     def create_search_button(self):
         """Create and return the search button."""
         search_button = QPushButton("SEARCH")
@@ -191,11 +247,13 @@ class PropertyPriceEstimation(QWidget):
     def add_widgets_to_layout(self, layout):
         """Add all widgets to the layout."""
         layout.addWidget(self.typeBox, alignment=Qt.AlignmentFlag.AlignHCenter)
+        layout.addWidget(self.locationSearch, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.districtBox, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.communeBox, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.sizeInput, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.bedroomsInput, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.bathroomsInput, alignment=Qt.AlignmentFlag.AlignHCenter)
+        layout.addWidget(self.previewLabel, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.searchButton, alignment=Qt.AlignmentFlag.AlignHCenter)
         layout.addWidget(self.searchHistoryButton, alignment=Qt.AlignmentFlag.AlignHCenter)
 
@@ -203,117 +261,165 @@ class PropertyPriceEstimation(QWidget):
         """Set the background image for the window."""
         palette = QPalette()
         try:
-            pixmap = QPixmap("resource/background.png") 
-            palette.setBrush(QPalette.ColorRole.Window, QBrush(pixmap))
+            palette.setBrush(QPalette.ColorRole.Window, QBrush(background_pixmap()))
         except Exception:
             palette.setColor(QPalette.ColorRole.Window, Qt.GlobalColor.white)
         self.setPalette(palette)
 
     def on_view_search_history_click(self): 
         """Open the search historywindow."""
-        self.searchHistoryWindow = SearchHistoryWindow()
+        if self.searchHistoryWindow is None:
+            self.searchHistoryWindow = SearchHistoryWindow()
+        else:
+            self.searchHistoryWindow.refresh()
         self.searchHistoryWindow.show()
+        self.searchHistoryWindow.raise_()
+        self.searchHistoryWindow.activateWindow()
 
+    @pyqtSlot()
+    @timed("PropertyPriceEstimation.on_search_click")
     def on_search_click(self):
-    
-        # Validate property type selection
-        property_type = self.typeBox.currentText()
-        property_type_mapping = {
-            "House": 1,
-            "Condo/Apartment": 2,
-            "Land": 3
-        }
-        property_type_id = property_type_mapping.get(property_type, None)
-        if not property_type_id:
-            self.show_error_message("Please select a property type.")
+        # Validate the form with the same rules the valuation service uses
+        try:
+            search = validate_search(
+                self.typeBox.currentText(),
+                self.districtBox.currentText() if self.districtBox.currentIndex() > 0 else None,
+                self.communeBox.currentText() if self.communeBox.currentIndex() > 0 else None,
+                self.sizeInput.text(),
+                self.bedroomsInput.text(),
+                self.bathroomsInput.text(),
+                self.gazetteer)
+        except SearchValidationError as e:
+            self.show_error_message(str(e))
             return
-        # Validate commune selection
-        selected_commune = self.communeBox.currentText()
-        if selected_commune == "Select your commune/Sangkat":
-            self.show_error_message("Please select your commune.")
+
+        # Ignore repeated clicks while a valuation is still running
+        if self.valuation_worker is not None:
             return
 
+        # Estimate the price and save the search in the background
+        worker = ValuationWorker(search)
+        worker.signals.progress.connect(self.on_valuation_progress)
+        worker.signals.finished.connect(self.on_valuation_finished)
+        worker.signals.failed.connect(self.on_valuation_failed)
+        worker.signals.cancelled.connect(self.on_valuation_cancelled)
+        self.valuation_worker = worker
+        self.searchButton.setEnabled(False)
 
-        # Validate size input
-        size_value = self.sizeInput.text().strip()
-        if not size_value:
-            self.show_error_message("Please enter the property size in square meters.")
-            return
-        try:
-            size_value = float(size_value)
-            if size_value <= 0:
-                raise ValueError
-        except ValueError:
-            self.show_error_message("Please enter a valid number for the property size.")
-            return
+        # Show loading dialog
+        self.loading_dialog = QProgressDialog("Loading...", "Cancel", 0, 100, self)
+        self.loading_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.loading_dialog.setMinimumDuration(300)
+        self.loading_dialog.setAutoClose(True)
+        self.loading_dialog.setAutoReset(True)
+        self.loading_dialog.canceled.connect(worker.cancel)
+        self.loading_dialog.setValue(0)
 
-        # Validate number of bedrooms (optional but if entered, must be a valid integer)
-        bedrooms_value = self.bedroomsInput.text().strip()
-        if bedrooms_value:
-            try:
-                bedrooms_value = int(bedrooms_value)
-                if bedrooms_value < 0:
-                    raise ValueError  # Ensure it is a non-negative integer
-            except ValueError:
-                self.show_error_message("Please enter a valid number for the number of bedrooms.")
-                return
-        else:
-            bedrooms_value = 0  # Default to 0 if left empty
-
-        # Validate number of bathrooms (optional but if entered, must be a valid integer)
-        bathrooms_value = self.bathroomsInput.text().strip()
-        if bathrooms_value:
-            try:
-                bathrooms_value = int(bathrooms_value)
-                if bathrooms_value < 0:
-                    raise ValueError  # Ensure it is a non-negative integer
-            except ValueError:
-                self.show_error_message("Please enter a valid number for the number of bathrooms.")
-                return
-        else:
-            bathrooms_value = 0  # Default to 0 if left empty
-
-        # Find the coordinates (latitude, longitude) for the selected commune
-        latitude, longitude = None, None
-        for commune in self.commune_data:
-            if commune['en_name'] == selected_commune:
-                latitude = commune['map']['x']
-                longitude = commune['map']['y']
-                break
-        
-        # Check if commune coordinates are found
-        if latitude is None or longitude is None:
-            self.show_error_message("Commune data not found.")
+        QThreadPool.globalInstance().start(worker)
+
+    def on_valuation_progress(self, value, message):
+        """Reflect the worker's progress in the loading dialog."""
+        if self.loading_dialog is not None and not self.loading_dialog.wasCanceled():
+            self.loading_dialog.setLabelText(message)
+            self.loading_dialog.setValue(value)
+
+    def on_valuation_finished(self, search):
+        """Show the result window once the background valuation is done."""
+        cancelled = self.valuation_worker.is_cancelled()
+        self.finish_valuation()
+        if cancelled:
             return
+        details = (
+            search['property_type'],
+            search['district'],
+            search['commune'],
+            search['price'],
+            search['size_value'],
+            search['bedrooms_value'],
+            search['bathrooms_value'])
+        if self.resultWindow is None:
+            self.resultWindow = ResultWindow(*details, search['search_id'])
+        else:
+            self.resultWindow.update_result(*details, search['search_id'])
+        self.resultWindow.present()
 
-        # Estimate the price
-        price = estimate_price(property_type_id, latitude, longitude, size_value, bedrooms_value, bathrooms_value)
+    def on_valuation_failed(self, details):
+        """Report an exception raised by the background valuation."""
+        self.finish_valuation()
+        self.show_error_message(f"Could not estimate the price.\n\n{details}")
 
-        # Save search result to database
-        save_search(property_type, self.districtBox.currentText(), self.communeBox.currentText(), price, size_value, bedrooms_value, bathrooms_value)
+    def on_valuation_cancelled(self):
+        self.finish_valuation()
 
-        # Show loading dialog
-        loading_dialog = QProgressDialog("Loading...", "Cancel", 0, 100, self)
-        loading_dialog.setWindowModality(Qt.WindowModality.WindowModal)
-        loading_dialog.setAutoClose(True)
-        loading_dialog.setAutoReset(True)
-        loading_dialog.show()
-        
-        # Close the loading dialog once the price is calculated
-        loading_dialog.close()
+    def finish_valuation(self):
+        """Close the loading dialog and accept new searches again."""
+        if self.loading_dialog is not None:
+            self.loading_dialog.close()
+            self.loading_dialog = None
+        self.valuation_worker = None
+        self.searchButton.setEnabled(True)
 
-        # Show the result window
-        self.resultWindow = ResultWindow(
-            property_type, 
-            self.districtBox.currentText(), 
-            self.communeBox.currentText(), 
-            price,
-            size_value, 
-            bedrooms_value, 
-            bathrooms_value)
-        self.resultWindow.show()
+    def stop_workers(self):
+        """Cancel the running valuation and preview and wait for the pool, so no worker outlives the app."""
+        for worker in (self.valuation_worker, self.preview_worker):
+            if worker is not None:
+                worker.cancel()
+        QThreadPool.globalInstance().waitForDone()
 
 
+    def schedule_preview(self):
+        """Restart the preview delay; a burst of edits yields one preview."""
+        self.preview_generation += 1
+        self.previewTimer.start()
+
+    def start_preview(self):
+        """Estimate the price of the current input in the background, unsaved."""
+        if self.preview_in_flight:
+            # Runs again from on_preview_finished with the newest input.
+            return
+        try:
+            search = validate_search(
+                self.typeBox.currentText(),
+                self.districtBox.currentText() if self.districtBox.currentIndex() > 0 else None,
+                self.communeBox.currentText() if self.communeBox.currentIndex() > 0 else None,
+                self.sizeInput.text(),
+                self.bedroomsInput.text(),
+                self.bathroomsInput.text(),
+                self.gazetteer)
+        except SearchValidationError:
+            self.previewLabel.clear()
+            return
+
+        worker = PreviewWorker(self.preview_generation, search)
+        worker.signals.finished.connect(self.on_preview_finished)
+        worker.signals.failed.connect(self.on_preview_failed)
+        self.preview_in_flight = True
+        self.preview_worker = worker
+        self.preview_started_at = time.perf_counter()
+        QThreadPool.globalInstance().start(worker)
+
+    def on_preview_finished(self, generation, price):
+        """Show a preview price unless the input changed while it was computed."""
+        self.preview_in_flight = False
+        self.preview_worker = None
+        if generation != self.preview_generation:
+            self.start_preview()
+            return
+        latency = time.perf_counter() - self.preview_started_at
+        observe("PropertyPriceEstimation.preview_latency", latency)
+        if latency > PREVIEW_BUDGET:
+            logger.warning("Price preview took %.1f ms", latency * 1000)
+        self.previewLabel.setText(f"Estimated Price: {price}")
+        self.previewLabel.setToolTip(f"Preview computed in {latency * 1000:.1f} ms")
+
+    def on_preview_failed(self, generation, details):
+        self.preview_in_flight = False
+        self.preview_worker = None
+        if generation != self.preview_generation:
+            self.start_preview()
+            return
+        self.previewLabel.clear()
+
     def update_fields_visibility(self):
         """Update visibility of input fields based on selected property type."""
         property_type = self.typeBox.currentText()
@@ -327,19 +433,40 @@ class PropertyPriceEstimation(QWidget):
         self.sizeInput.clear    
         self.bedroomsInput.clear()
 
+    def update_location_matches(self, text):
+        """Suggest the districts and communes best matching the typed text."""
+        matches = self.location_index.search(text, LOCATION_MATCHES)
+        self.location_matches = {location.label: location for location in matches}
+        self.locationCompleter.model().setStringList(list(self.location_matches))
+        if matches:
+            self.locationCompleter.complete()
+
+    def on_location_chosen(self, label):
+        """Select the chosen district, and commune if one was picked, in the combo boxes."""
+        location = self.location_matches.get(label)
+        if location is None:
+            return
+        # Changing the district refills the commune box through update_commune_box.
+        self.districtBox.setCurrentIndex(max(self.districtBox.findText(location.district), 0))
+        if location.kind == 'commune':
+            self.communeBox.setCurrentIndex(max(self.communeBox.findText(location.en_name), 0))
+
     def update_commune_box(self):
         """Update the commune combo box based on selected district."""
         selected_district = self.districtBox.currentText()
         self.communeBox.clear()
         self.communeBox.addItem("Select your commune/Sangkat")
-        for commune in self.commune_data:
-            if commune['district_slug'] == selected_district.lower().replace(" ", "-"):
-                self.communeBox.addItem(commune['en_name'])
+        self.communeBox.addItems(self.gazetteer.commune_names(selected_district))
 
-    def show_error_message(self, message):
+    def show_error_message(self, message, title="Input Error"):
         """Show an error message in a message box."""
         msg = QMessageBox(self)
         msg.setIcon(QMessageBox.Icon.Critical)
         msg.setText(message)
-        msg.setWindowTitle("Input Error")
+        msg.setWindowTitle(title)
         msg.exec()
+
+    def show_model_error(self, details):
+        """Report price models that failed to load in the background."""
+        self.show_error_message(f"Some price models could not be loaded; searches that need them may fail.\n\n{details}",
+                                "Model Error")
@@ -1,19 +1,25 @@
-from math import isclose
-from search_database import get_recent_searches, get_search_by_id
+from gazetteer import get_gazetteer
+from metrics import timed
+from history_model import SearchHistoryModel
+from model import format_price
+from resources import background_pixmap, logo_pixmap
 from result import ResultWindow
+from search_database import get_search_summary
 from PyQt6.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QTableWidget, 
-    QTableWidgetItem, QHeaderView
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTableView,
+    QHeaderView, QComboBox
 )
-from PyQt6.QtGui import QPixmap, QPalette, QBrush, QFont
+from PyQt6.QtGui import QPalette, QBrush, QFont
 from PyQt6.QtCore import Qt
 
 class SearchHistoryWindow(QWidget):
     def __init__(self):
         super().__init__()
+        self.resultWindow = None
         self.initUI()
 
        
+    @timed("SearchHistoryWindow.initUI")
     def initUI(self):
         self.setWindowTitle("Search History")
         self.setGeometry(100, 100, 800, 1000)
@@ -29,19 +35,32 @@ class SearchHistoryWindow(QWidget):
         layout.addWidget(title_label)
         layout.addWidget(subtitle_label)
 
-        # Table Widget (Custom Style)
-        self.tableWidget = QTableWidget()
-        self.tableWidget.setColumnCount(4)
-        self.tableWidget.setHorizontalHeaderLabels(["Property Type", "District", "Commune", "Price"])
-        self.tableWidget.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.tableWidget.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-        self.tableWidget.setStyleSheet(self.table_style()) 
-        self.tableWidget.cellClicked.connect(self.row_clicked)
+        # Filters
+        layout.addLayout(self.create_filters())
+
+        # Totals for the filtered searches
+        self.summaryLabel = QLabel()
+        self.summaryLabel.setFont(QFont("Arial", 14))
+        self.summaryLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.summaryLabel)
+
+        # Table View backed by a lazily fetched model (Custom Style)
+        self.historyModel = SearchHistoryModel(self)
+        self.tableView = QTableView()
+        self.tableView.setModel(self.historyModel)
+        self.tableView.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.tableView.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+        self.tableView.setStyleSheet(self.table_style())
+        self.tableView.verticalHeader().hide()
+        # Newest first until a column header is clicked
+        self.tableView.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.DescendingOrder)
+        self.tableView.setSortingEnabled(True)
+        self.tableView.clicked.connect(self.row_clicked)
 
         # Adjust column width
-        self.tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.tableView.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
 
-        layout.addWidget(self.tableWidget)
+        layout.addWidget(self.tableView)
         self.setLayout(layout)
 
         self.set_background_image()
@@ -51,9 +70,7 @@ class SearchHistoryWindow(QWidget):
         """Create and return the logo label."""
         logo_label = QLabel(self)
         try:
-            logo_pixmap = QPixmap("resource/logo.png")
-            logo_pixmap = logo_pixmap.scaled(193, 193, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            logo_label.setPixmap(logo_pixmap)
+            logo_label.setPixmap(logo_pixmap())
         except Exception:
             logo_label.setText("Logo not found")
         logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -73,47 +90,96 @@ class SearchHistoryWindow(QWidget):
     def set_background_image(self):
         palette = QPalette()
         try:
-            pixmap = QPixmap("resource/background.png") 
-            palette.setBrush(QPalette.ColorRole.Window, QBrush(pixmap))
+            palette.setBrush(QPalette.ColorRole.Window, QBrush(background_pixmap()))
         except Exception:
             palette.setColor(QPalette.ColorRole.Window, Qt.GlobalColor.white)
         self.setPalette(palette)
 
-    def load_recent_searches(self):
-        searches = get_recent_searches()
-        self.tableWidget.setRowCount(len(searches))
-
-        for row, search in enumerate(searches):
-            search_id, property_type, district, commune, price, size, bedrooms, bathrooms = search
-            data_list = [property_type, district, commune, price]
-
-            for col, data in enumerate(data_list):
-                item = QTableWidgetItem(data)
-                item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                self.tableWidget.setItem(row, col, item)
+    def create_filters(self):
+        """Create the property type, district and commune filter boxes."""
+        filters_layout = QHBoxLayout()
+
+        self.typeFilter = QComboBox()
+        self.typeFilter.addItems(["All types", "House", "Condo/Apartment", "Land"])
+        self.typeFilter.currentIndexChanged.connect(self.apply_filters)
+        filters_layout.addWidget(self.typeFilter)
+
+        self.districtFilter = QComboBox()
+        self.districtFilter.addItem("All districts")
+        for district in get_gazetteer().districts:
+            self.districtFilter.addItem(district['en_name'])
+        self.districtFilter.currentIndexChanged.connect(self.update_commune_filter)
+        filters_layout.addWidget(self.districtFilter)
+
+        # Commune names repeat across districts, so a district must be picked first
+        self.communeFilter = QComboBox()
+        self.communeFilter.addItem("All communes")
+        self.communeFilter.setEnabled(False)
+        self.communeFilter.currentIndexChanged.connect(self.apply_filters)
+        filters_layout.addWidget(self.communeFilter)
+
+        return filters_layout
+
+    def update_commune_filter(self):
+        """List the selected district's communes, then reload the table once."""
+        self.communeFilter.blockSignals(True)
+        self.communeFilter.clear()
+        self.communeFilter.addItem("All communes")
+        if self.districtFilter.currentIndex() > 0:
+            self.communeFilter.addItems(get_gazetteer().commune_names(self.districtFilter.currentText()))
+        self.communeFilter.setEnabled(self.districtFilter.currentIndex() > 0)
+        self.communeFilter.blockSignals(False)
+        self.apply_filters()
+
+    def apply_filters(self):
+        """Reload the table with the selected property type, district and commune."""
+        self.historyModel.set_filters(
+            property_type=self.typeFilter.currentText() if self.typeFilter.currentIndex() > 0 else None,
+            district=self.districtFilter.currentText() if self.districtFilter.currentIndex() > 0 else None,
+            commune=self.communeFilter.currentText() if self.communeFilter.currentIndex() > 0 else None)
+        self.update_summary()
+
+    def update_summary(self):
+        """Show the count and price range of the searches the filters match."""
+        count, average, minimum, maximum = get_search_summary(self.historyModel.filters())
+        if not count:
+            self.summaryLabel.setText("No searches yet")
+            return
+        self.summaryLabel.setText(
+            f"{count:,} searches  |  Average {format_price(average)}  |  "
+            f"{format_price(minimum)} to {format_price(maximum)}")
 
-                if col == 0:
-                    item.setData(Qt.ItemDataRole.UserRole, search_id)
-
-    def row_clicked(self, row):
-        search_id = self.tableWidget.item(row, 0).data(Qt.ItemDataRole.UserRole)
-        search_data = get_search_by_id(search_id)
-
-        if search_data:
-            property_type, district, commune, price, size, bedrooms, bathrooms = search_data
-            self.resultWindow = ResultWindow(property_type, district, commune, price, size, bedrooms, bathrooms)
-            self.resultWindow.show()
+    def load_recent_searches(self):
+        self.historyModel.reload()
+        self.update_summary()
+
+    def refresh(self):
+        """Add the searches saved since the table was last loaded."""
+        self.historyModel.refresh()
+        self.update_summary()
+
+    def row_clicked(self, index):
+        # The model already holds every column of the row; no need to query again.
+        search_id, property_type, district, commune, price, size, bedrooms, bathrooms = self.historyModel.search_at(index.row())
+        price = format_price(price) if price is not None else ""
+        if self.resultWindow is None:
+            self.resultWindow = ResultWindow(property_type, district, commune, price, size, bedrooms, bathrooms,
+                                             search_id)
+        else:
+            self.resultWindow.update_result(property_type, district, commune, price, size, bedrooms, bathrooms,
+                                            search_id)
+        self.resultWindow.present()
 
     def table_style(self):
         return """
-            QTableWidget {
+            QTableView {
                 background-color: #2C2F33;
                 color: #FFFFFF;
                 font-size: 16px;
                 border-radius: 10px;
                 gridline-color: #444;
             }
-            QTableWidget::item {
+            QTableView::item {
                 border-bottom: 1px solid #444;
                 padding: 10px;
             }
@@ -125,7 +191,7 @@ class SearchHistoryWindow(QWidget):
                 padding: 10px;
                 border: none;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #3094CE;
                 color: #FFFFFF;
             }
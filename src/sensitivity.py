@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from metrics import timed
+from model import estimate_prices_batch, registry
+from price_tiles import GRIDS
+
+SIZE_POINTS = 200  # points on the price-versus-size curve
+MAX_ROOMS = 8  # room counts swept for houses: MAX_ROOMS + 1 values, 0..MAX_ROOMS unless more are entered
+CACHE_SIZE = 64  # price surfaces kept, one per (commune, property type)
+
+class PriceSurface:
+    """Prices of one property type at one commune over sizes x bedrooms x bathrooms.
+
+    Every what-if curve for that commune and type is a slice of it, so the
+    curves for any entered values come from one predict call.
+    """
+
+    def __init__(self, sizes, bedrooms, bathrooms, prices):
+        self.sizes = sizes
+        self.bedrooms = bedrooms
+        self.bathrooms = bathrooms
+        self.prices = prices  # shape (len(sizes), len(bedrooms), len(bathrooms))
+
+    def covers(self, size_value, bedrooms_value, bathrooms_value):
+        return (self.sizes[0] <= size_value <= self.sizes[-1]
+                and self.bedrooms[0] <= bedrooms_value <= self.bedrooms[-1]
+                and self.bathrooms[0] <= bathrooms_value <= self.bathrooms[-1])
+
+    def _at_size(self, size_value):
+        """Return the (bedrooms, bathrooms) price grid at a size, interpolated."""
+        upper = int(np.clip(np.searchsorted(self.sizes, size_value), 1, len(self.sizes) - 1))
+        lower = upper - 1
+        weight = (size_value - self.sizes[lower]) / (self.sizes[upper] - self.sizes[lower])
+        return self.prices[lower] + weight * (self.prices[upper] - self.prices[lower])
+
+    def size_curve(self, bedrooms_value=0, bathrooms_value=0):
+        """Return (sizes, prices) with the room counts held fixed."""
+        return self.sizes, self.prices[:, self._room(self.bedrooms, bedrooms_value),
+                                       self._room(self.bathrooms, bathrooms_value)]
+
+    def bedrooms_curve(self, size_value, bathrooms_value=0):
+        """Return (bedroom counts, prices) with the size and bathrooms held fixed."""
+        return self.bedrooms, self._at_size(size_value)[:, self._room(self.bathrooms, bathrooms_value)]
+
+    def bathrooms_curve(self, size_value, bedrooms_value=0):
+        """Return (bathroom counts, prices) with the size and bedrooms held fixed."""
+        return self.bathrooms, self._at_size(size_value)[self._room(self.bedrooms, bedrooms_value), :]
+
+    @staticmethod
+    def _room(axis, value):
+        """Return the index in `axis` of a room count, clamped to the swept range."""
+        return int(np.clip(value, axis[0], axis[-1]) - axis[0])
+
+def _room_axis(value):
+    """Return the MAX_ROOMS + 1 room counts swept for an entered count, centred on it where possible."""
+    start = max(0, int(value) - MAX_ROOMS // 2)
+    return np.arange(start, start + MAX_ROOMS + 1)
+
+@timed("sensitivity.build_surface")
+def build_surface(property_type, latitude, longitude, size_value=0, bedrooms_value=0, bathrooms_value=0):
+    """Sweep the model for one commune in a single estimate_prices_batch call.
+
+    Sizes span the price tile grid for the type, widened to include
+    size_value; houses also sweep MAX_ROOMS + 1 bedroom and bathroom counts
+    around the entered ones, so the grid stays the same size however many
+    rooms are entered.
+    """
+    grid_sizes = GRIDS[property_type][0]
+    low = min(grid_sizes[0], size_value / 2) if size_value else grid_sizes[0]
+    high = max(grid_sizes[-1], size_value * 2)
+    sizes = np.linspace(low, high, SIZE_POINTS)
+    if property_type == 1:
+        bedrooms, bathrooms = _room_axis(bedrooms_value), _room_axis(bathrooms_value)
+    else:
+        bedrooms = bathrooms = np.zeros(1, dtype=np.int64)
+
+    size_grid, bedroom_grid, bathroom_grid = np.meshgrid(sizes, bedrooms, bathrooms, indexing='ij')
+    count = size_grid.size
+    prices = estimate_prices_batch(
+        np.full(count, property_type), np.full(count, latitude), np.full(count, longitude),
+        size_grid.ravel(), bedroom_grid.ravel(), bathroom_grid.ravel())
+    return PriceSurface(sizes, bedrooms, bathrooms, prices.reshape(size_grid.shape))
+
+class SurfaceCache:
+    """LRU of PriceSurface keyed by (property type, latitude, longitude)."""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, property_type, latitude, longitude, size_value=0, bedrooms_value=0, bathrooms_value=0):
+        """Return the cached surface if it covers the entered values, else None."""
+        key = (property_type, latitude, longitude)
+        with self._lock:
+            surface = self._surfaces.get(key)
+            if surface is None or not surface.covers(size_value, bedrooms_value, bathrooms_value):
+                return None
+            self._surfaces.move_to_end(key)
+            return surface
+
+    def get_or_build(self, property_type, latitude, longitude, size_value=0, bedrooms_value=0, bathrooms_value=0):
+        """Return a surface covering the entered values, building it on a miss."""
+        surface = self.get(property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value)
+        if surface is None:
+            surface = build_surface(property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value)
+            with self._lock:
+                self._surfaces[(property_type, latitude, longitude)] = surface
+                self._surfaces.move_to_end((property_type, latitude, longitude))
+                while len(self._surfaces) > self.max_size:
+                    self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        with self._lock:
+            self._surfaces.clear()
+
+surface_cache = SurfaceCache()
+# Surfaces are only valid for the model version that built them.
+registry.add_listener(lambda property_type, version: surface_cache.clear())
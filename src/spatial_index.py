@@ -0,0 +1,64 @@
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+from gazetteer import get_gazetteer
+
+# Kilometres per degree of latitude; longitude degrees are scaled by the
+# cosine of the reference latitude (an equirectangular projection, which is
+# accurate to well under 1% across a province).
+KM_PER_DEGREE = 111.195
+
+class CommuneIndex:
+    """KD-tree over the gazetteer's commune centroids.
+
+    Coordinates are projected to kilometres around the mean latitude so
+    that tree distances are real distances. Every query is vectorized over
+    arrays of latitudes and longitudes.
+    """
+
+    def __init__(self, gazetteer):
+        self.gazetteer = gazetteer
+        self.reference_latitude = float(np.mean(gazetteer.coordinates[:, 0]))
+        self._longitude_scale = np.cos(np.radians(self.reference_latitude))
+        self.tree = cKDTree(self.project(gazetteer.coordinates[:, 0], gazetteer.coordinates[:, 1]))
+        self._district_names = {district['slug']: district['en_name'] for district in gazetteer.districts}
+
+    def project(self, latitudes, longitudes):
+        """Return an (n, 2) array of kilometre coordinates."""
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        return np.column_stack([latitudes * KM_PER_DEGREE,
+                                longitudes * KM_PER_DEGREE * self._longitude_scale])
+
+    def nearest(self, latitudes, longitudes, k=1):
+        """Return (distances in km, commune rows) of the k nearest communes."""
+        return self.tree.query(self.project(latitudes, longitudes), k=k, workers=-1)
+
+    def within_radius(self, latitudes, longitudes, radius_km):
+        """Return, for each point, an array of commune rows within radius_km."""
+        found = self.tree.query_ball_point(self.project(latitudes, longitudes), r=radius_km, workers=-1)
+        return [np.asarray(sorted(rows), dtype=np.intp) for rows in found]
+
+    def reverse_geocode(self, latitudes, longitudes):
+        """Snap points to their nearest commune.
+
+        Returns (commune names, district names, distances in km), the first
+        two as lists and the last as an array, in input order.
+        """
+        distances, rows = self.nearest(latitudes, longitudes)
+        communes = [self.gazetteer.communes[row] for row in rows]
+        return ([commune['en_name'] for commune in communes],
+                [self._district_names.get(commune['district_slug'], commune['district_slug']) for commune in communes],
+                distances)
+
+_index = None
+_lock = threading.Lock()
+
+def get_commune_index():
+    """Return the process-wide CommuneIndex, building it on first use."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = CommuneIndex(get_gazetteer())
+    return _index
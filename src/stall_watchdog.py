@@ -0,0 +1,160 @@
+"""Opt-in detector for a blocked Qt GUI thread.
+
+Set HOME_EVA_STALL_MS=50 to report every time the event loop stops
+processing events for longer than 50 ms. A timer on the GUI thread beats
+every HEARTBEAT_MS; a watchdog thread that sees the beat overdue samples the
+GUI thread's Python stack with sys._current_frames(), and once the loop
+runs again logs the stall's duration, the slot that was running and the
+stack. Stalls are also aggregated per (slot, call site), recorded as
+"gui_stall.<slot>" in metrics, and ranked by total blocked time in a
+summary logged at exit (or returned by report()).
+
+With the variable unset, install() does nothing and returns None.
+"""
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from PyQt6.QtCore import Qt, QTimer
+from metrics import observe
+
+THRESHOLD_MS = float(os.environ.get("HOME_EVA_STALL_MS", "0") or 0)
+HEARTBEAT_MS = 10  # how often the GUI thread proves it is processing events
+SUMMARY_SITES = 10  # worst call sites listed in the summary at exit
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+class StallSite:
+    """Stalls that happened in one slot at one line of the app's code."""
+
+    __slots__ = ("slot", "site", "count", "total", "maximum", "stack")
+
+    def __init__(self, slot, site):
+        self.slot = slot
+        self.site = site
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.stack = ""  # stack of the longest stall
+
+    def add(self, seconds, stack):
+        self.count += 1
+        self.total += seconds
+        if seconds >= self.maximum:
+            self.maximum = seconds
+            self.stack = stack
+
+def _function_name(frame):
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{module}.{frame.f_code.co_qualname}"
+
+def describe_stack(frame):
+    """Return (slot, call site, formatted stack) for a GUI thread frame.
+
+    The outermost frame is the one that called app.exec(), so the frame
+    above it is the slot Qt invoked. The call site is the innermost frame
+    in the app's own source, which is where a library call blocked.
+    """
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    slot = _function_name(frames[1] if len(frames) > 1 else frames[0])
+    own = [f for f in frames if os.path.dirname(os.path.abspath(f.f_code.co_filename)) == SOURCE_DIR]
+    inner = (own or frames)[-1]
+    site = f"{os.path.basename(inner.f_code.co_filename)}:{inner.f_lineno} in {inner.f_code.co_qualname}"
+    stack = "".join(traceback.format_stack(frames[-1]))
+    return slot, site, stack
+
+class StallWatchdog:
+    """Detects and records GUI event-loop stalls longer than `threshold` seconds.
+
+    Create it on the GUI thread; the heartbeat timer lives there and the
+    watchdog thread compares its last beat with the clock.
+    """
+
+    def __init__(self, threshold, heartbeat=HEARTBEAT_MS / 1000, parent=None):
+        self.threshold = threshold
+        self.heartbeat = heartbeat
+        self.gui_thread = threading.get_ident()
+        self.sites = {}
+        self._lock = threading.Lock()
+        self._last_beat = time.perf_counter()
+        self._stop = threading.Event()
+        self._timer = QTimer(parent)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(int(heartbeat * 1000))
+        self._timer.timeout.connect(self._beat)
+        self._thread = threading.Thread(target=self._watch, name="gui-stall-watchdog", daemon=True)
+
+    def start(self):
+        self._last_beat = time.perf_counter()
+        self._timer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._timer.stop()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _beat(self):
+        self._last_beat = time.perf_counter()
+
+    def _watch(self):
+        stalled = None  # (beat before the stall, slot, site, stack) once the GUI thread is sampled
+        while not self._stop.wait(self.heartbeat):
+            last_beat = self._last_beat
+            if stalled is not None:
+                if last_beat != stalled[0]:
+                    # The loop ran again; the gap between the beats is how long it was blocked.
+                    self._record(last_beat - stalled[0], *stalled[1:])
+                    stalled = None
+                continue
+            if time.perf_counter() - last_beat > self.threshold + self.heartbeat:
+                frame = sys._current_frames().get(self.gui_thread)
+                if frame is not None:
+                    stalled = (last_beat, *describe_stack(frame))
+
+    def _record(self, seconds, slot, site, stack):
+        with self._lock:
+            key = (slot, site)
+            entry = self.sites.get(key)
+            if entry is None:
+                entry = self.sites[key] = StallSite(slot, site)
+            entry.add(seconds, stack)
+        observe(f"gui_stall.{slot}", seconds)
+        logger.warning("GUI thread blocked for %.0f ms in %s at %s\n%s", seconds * 1000, slot, site, stack)
+
+    def report(self):
+        """Return the StallSites, the most total blocked time first."""
+        with self._lock:
+            return sorted(self.sites.values(), key=lambda entry: entry.total, reverse=True)
+
+    def log_summary(self, limit=SUMMARY_SITES):
+        sites = self.report()
+        if not sites:
+            return
+        lines = [f"{entry.total * 1000:8.0f} ms total  {entry.count:4d} stalls  "
+                 f"{entry.maximum * 1000:6.0f} ms max  {entry.slot} at {entry.site}"
+                 for entry in sites[:limit]]
+        logger.warning("GUI stalls by call site:\n%s", "\n".join(lines))
+
+def install(app, threshold_ms=None):
+    """Start a StallWatchdog for `app` if enabled; return it, or None.
+
+    `threshold_ms` defaults to HOME_EVA_STALL_MS. Call this on the GUI
+    thread before app.exec().
+    """
+    threshold_ms = THRESHOLD_MS if threshold_ms is None else threshold_ms
+    if threshold_ms <= 0:
+        return None
+    watchdog = StallWatchdog(threshold_ms / 1000, parent=app)
+    watchdog.start()
+    atexit.register(watchdog.log_summary)
+    return watchdog
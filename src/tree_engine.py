@@ -0,0 +1,136 @@
+import numpy as np
+
+# Rows scored per pass; bounds the (rows x trees) node-index scratch array.
+CHUNK_SIZE = 8192
+
+class CompiledEnsemble:
+    """A gradient-boosting regressor flattened into contiguous NumPy arrays.
+
+    Every tree is padded to a perfect binary tree of the ensemble's depth and
+    stored in heap order, so the children of node i are 2i+1 and 2i+2 and
+    need no array of their own. `feature` and `threshold` hold one row of
+    internal nodes per tree, `leaf_value` one row of leaves per tree (already
+    scaled by the learning rate). Padding nodes send every row left.
+    """
+
+    def __init__(self, feature, threshold, leaf_value, init, depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.leaf_value = leaf_value
+        self.init = init
+        self.depth = depth
+        self.n_features = n_features
+        self.n_trees = leaf_value.shape[0]
+        self._internal_base = np.arange(self.n_trees, dtype=np.intp) * feature.shape[1]
+        self._leaf_base = np.arange(self.n_trees, dtype=np.intp) * leaf_value.shape[1]
+
+    def predict(self, X):
+        """Predict like GradientBoostingRegressor.predict for a 2D array."""
+        # sklearn validates tree inputs as float32, so round the same way
+        # before comparing against the float64 thresholds.
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected an array of shape (n, {self.n_features}), got {X.shape}")
+        # Checked after the float32 rounding, so values too large for float32 fail as in sklearn.
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN, infinity or a value too large for dtype('float32').")
+        out = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_SIZE):
+            out[start:start + CHUNK_SIZE] = self._predict_chunk(X[start:start + CHUNK_SIZE])
+        return out
+
+    def _predict_chunk(self, X):
+        feature = self.feature.ravel()
+        threshold = self.threshold.ravel()
+        flat_X = X.ravel()
+        row_base = (np.arange(X.shape[0], dtype=np.intp) * self.n_features)[:, None]
+        node = np.zeros((X.shape[0], self.n_trees), dtype=np.intp)
+        for _ in range(self.depth):
+            index = self._internal_base + node
+            go_right = flat_X[row_base + feature[index]] > threshold[index]
+            node = 2 * node + 1 + go_right
+        leaves = self.leaf_value.ravel()[self._leaf_base + node - self.feature.shape[1]]
+        # Accumulate stage by stage, in tree order, exactly as sklearn does.
+        stages = np.empty((X.shape[0], self.n_trees + 1), dtype=np.float64)
+        stages[:, 0] = self.init
+        stages[:, 1:] = leaves
+        return np.cumsum(stages, axis=1)[:, -1]
+
+def _fill_perfect_tree(tree, scale, depth, feature, threshold, leaf_value):
+    """Copy one sklearn tree into the heap-ordered arrays of a single tree."""
+    n_internal = feature.size
+    stack = [(0, 0, 0)]  # (sklearn node, heap position, level)
+    while stack:
+        source, position, level = stack.pop()
+        if level == depth:
+            leaf_value[position - n_internal] = scale * tree.value[source, 0, 0]
+            continue
+        if tree.children_left[source] == -1:
+            # Shallow leaf: route everything left down to level `depth`.
+            feature[position] = 0
+            threshold[position] = np.inf
+            stack.append((source, 2 * position + 1, level + 1))
+            stack.append((source, 2 * position + 2, level + 1))
+        else:
+            feature[position] = tree.feature[source]
+            threshold[position] = tree.threshold[source]
+            stack.append((tree.children_left[source], 2 * position + 1, level + 1))
+            stack.append((tree.children_right[source], 2 * position + 2, level + 1))
+
+def compile_ensemble(model):
+    """Flatten a fitted single-output GradientBoostingRegressor."""
+    trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+    depth = max(tree.max_depth for tree in trees)
+    feature = np.zeros((len(trees), 2 ** depth - 1), dtype=np.intp)
+    threshold = np.full((len(trees), 2 ** depth - 1), np.inf, dtype=np.float64)
+    leaf_value = np.zeros((len(trees), 2 ** depth), dtype=np.float64)
+    for i, tree in enumerate(trees):
+        _fill_perfect_tree(tree, model.learning_rate, depth, feature[i], threshold[i], leaf_value[i])
+
+    init = float(np.ravel(model._raw_predict_init(np.zeros((1, model.n_features_in_))))[0])
+    return CompiledEnsemble(feature, threshold, leaf_value, init, depth, model.n_features_in_)
+
+def golden_set(n_features, count=5000, seed=0):
+    """Random inputs spread over the ranges the app feeds the models."""
+    rng = np.random.default_rng(seed)
+    columns = [
+        rng.uniform(11.45, 11.65, count),      # latitude
+        rng.uniform(104.80, 105.00, count),    # longitude
+        rng.integers(10, 2000, count),         # size
+        rng.integers(0, 10, count),            # bedrooms
+        rng.integers(0, 10, count),            # bathrooms
+    ]
+    return np.column_stack(columns[:n_features]).astype(np.float64)
+
+if __name__ == "__main__":
+    # Golden-set check and benchmark against sklearn's own predict.
+    import time
+    import warnings
+    from model import house_model, condo_model, land_model
+
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    def best_of(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    for name, model in (("house", house_model), ("condo", condo_model), ("land", land_model)):
+        engine = compile_ensemble(model)
+        X = golden_set(engine.n_features)
+        expected = model.predict(X)
+        actual = engine.predict(X)
+        max_error = np.max(np.abs(expected - actual))
+        assert np.allclose(expected, actual, rtol=0, atol=1e-6), f"{name}: max abs error {max_error}"
+
+        print(f"{name}: exact={np.array_equal(expected, actual)} max_abs_error={max_error:.3g}")
+        for rows in (1, 32, 128, 512, len(X)):
+            batch = X[:rows]
+            repeat = 200 if rows <= 128 else 5
+            sklearn_time = best_of(lambda: model.predict(batch), repeat)
+            engine_time = best_of(lambda: engine.predict(batch), repeat)
+            print(f"  {rows:>5} rows: sklearn {sklearn_time * 1e6:8.0f} us, compiled {engine_time * 1e6:8.0f} us "
+                  f"({sklearn_time / engine_time:.1f}x)")
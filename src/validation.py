@@ -0,0 +1,80 @@
+import math
+from metrics import timed
+
+PROPERTY_TYPES = {
+    "House": 1,
+    "Condo/Apartment": 2,
+    "Land": 3
+}
+
+class SearchValidationError(ValueError):
+    """Raised with a user-facing message when search input is invalid."""
+
+def _parse_count(value, message):
+    """Parse an optional non-negative integer, defaulting to 0 when empty."""
+    value = '' if value is None else str(value).strip()
+    if not value:
+        return 0
+    try:
+        value = int(value)
+        if value < 0:
+            raise ValueError  # Ensure it is a non-negative integer
+    except ValueError:
+        raise SearchValidationError(message) from None
+    return value
+
+@timed("validation.validate_search")
+def validate_search(property_type, district, commune, size_value, bedrooms_value, bathrooms_value, gazetteer):
+    """Validate raw search input the way the search form does.
+
+    Values may be strings (form text) or numbers (JSON). `district` may be
+    None, in which case the commune's own district is used. Returns the
+    search dict ValuationWorker expects, without the price.
+    """
+    # Validate property type selection; JSON may hold any type, so check for text first
+    property_type_id = PROPERTY_TYPES.get(property_type) if isinstance(property_type, str) else None
+    if not property_type_id:
+        raise SearchValidationError("Please select a property type.")
+
+    # Validate commune and district selection
+    if not commune or not isinstance(commune, str):
+        raise SearchValidationError("Please select your commune.")
+    if district is not None and not isinstance(district, str):
+        raise SearchValidationError("Please select your district.")
+
+    # Validate size input
+    size_value = '' if size_value is None else str(size_value).strip()
+    if not size_value:
+        raise SearchValidationError("Please enter the property size in square meters.")
+    try:
+        size_value = float(size_value)
+        if not (math.isfinite(size_value) and size_value > 0):
+            raise ValueError
+    except ValueError:
+        raise SearchValidationError("Please enter a valid number for the property size.") from None
+
+    # Bedrooms and bathrooms are optional but, if entered, must be valid integers
+    bedrooms_value = _parse_count(bedrooms_value, "Please enter a valid number for the number of bedrooms.")
+    bathrooms_value = _parse_count(bathrooms_value, "Please enter a valid number for the number of bathrooms.")
+
+    # Find the coordinates (latitude, longitude) for the selected commune
+    row = gazetteer.commune_row(commune, district)
+    if row is None:
+        raise SearchValidationError("Commune data not found.")
+    latitude, longitude = gazetteer.coordinates[row]
+    if not district:
+        district_slug = gazetteer.communes[row]['district_slug']
+        found = gazetteer.district_by_slug.get(district_slug)
+        district = found['en_name'] if found else district_slug
+
+    return {
+        'property_type': property_type,
+        'property_type_id': property_type_id,
+        'district': district,
+        'commune': commune,
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'size_value': size_value,
+        'bedrooms_value': bedrooms_value,
+        'bathrooms_value': bathrooms_value,
+    }
@@ -0,0 +1,262 @@
+"""Headless HTTP valuation service.
+
+Run from the repository root, for example:
+
+    python src/valuation_server.py --port 8765 --log-searches
+
+POST /estimate takes a JSON object with property_type ("House",
+"Condo/Apartment" or "Land"), commune, optional district, size and optional
+bedrooms/bathrooms, validated exactly like the search form. Requests that
+arrive close together are scored in one estimate_prices_batch call.
+GET /health and GET /stats report liveness and batching counters.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from gazetteer import get_gazetteer
+from model import MODEL_VERSIONS, estimate_prices_batch, format_price, watch_models
+from search_database import create_database, save_search
+from validation import SearchValidationError, validate_search
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_WAIT = 0.002  # seconds a request may wait for others to batch with
+MAX_BODY_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Coalesce concurrent estimates into one batched prediction.
+
+    A batch is dispatched when it reaches max_batch_size or when its oldest
+    request has waited max_wait seconds, whichever comes first. Prediction
+    runs on a dedicated thread so the event loop keeps accepting requests
+    and batches queue up behind each other instead of competing for cores.
+    If a batch fails, its rows are scored one at a time, so only the
+    requests that caused the failure see it.
+    """
+
+    def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self._pending = []
+        self._timer = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="valuation-batcher")
+
+    async def estimate(self, search):
+        """Return the raw price for one validated search."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((search, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.rows += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        await self._score(batch)
+
+    async def _score(self, batch):
+        records = [(search['property_type_id'], search['latitude'], search['longitude'],
+                    search['size_value'], search['bedrooms_value'], search['bathrooms_value'])
+                   for search, _ in batch]
+        try:
+            prices = await asyncio.get_running_loop().run_in_executor(self._executor, estimate_prices_batch, records)
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self._score([item])
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), price in zip(batch, prices):
+            if not future.done():
+                future.set_result(float(price))
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "largest_batch": self.largest_batch,
+            "mean_batch": self.rows / self.batches if self.batches else 0.0,
+        }
+
+class ValuationServer:
+    """asyncio HTTP/1.1 server exposing estimate_price as JSON."""
+
+    def __init__(self, host="127.0.0.1", port=8765, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT, log_searches=False):
+        self.host = host
+        self.port = port
+        self.log_searches = log_searches
+        self.batcher = MicroBatcher(max_batch_size, max_wait)
+        self.gazetteer = get_gazetteer()
+        self._server = None
+
+    async def start(self):
+        """Start listening and return the bound port (useful with port=0)."""
+        if self.log_searches:
+            create_database()
+        # Retrained models are picked up without dropping connections.
+        watch_models()
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line."}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_SIZE:
+                    await self.send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Request body too large."}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = await self.route(method, path.split('?', 1)[0], body)
+                    await self.send(writer, status, payload, keep_alive)
+                except ConnectionError:
+                    raise
+                except Exception:
+                    logger.exception("Failed to answer %s %s", method, path)
+                    await self.send(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error."},
+                                    keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if path == '/estimate':
+            if method != 'POST':
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST."}
+            return await self.estimate(body)
+        if path == '/health' and method == 'GET':
+            return HTTPStatus.OK, {"status": "ok"}
+        if path == '/stats' and method == 'GET':
+            return HTTPStatus.OK, self.batcher.stats()
+        return HTTPStatus.NOT_FOUND, {"error": "Not found."}
+
+    async def estimate(self, body):
+        try:
+            request = json.loads(body or b'null')
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": "Request body must be JSON."}
+        if not isinstance(request, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "Request body must be a JSON object."}
+
+        try:
+            search = validate_search(
+                request.get('property_type'), request.get('district'), request.get('commune'),
+                request.get('size'), request.get('bedrooms'), request.get('bathrooms'), self.gazetteer)
+        except SearchValidationError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+
+        model_version = MODEL_VERSIONS[search['property_type_id']]
+        try:
+            price = await self.batcher.estimate(search)
+        except ValueError:
+            # estimate_prices_batch rejects features the model cannot take, such as sizes beyond float32.
+            return HTTPStatus.BAD_REQUEST, {"error": "This search cannot be priced."}
+        formatted_price = format_price(price)
+        if self.log_searches:
+            save_search(search['property_type'], search['district'], search['commune'], price,
+                        search['size_value'], search['bedrooms_value'], search['bathrooms_value'], model_version)
+
+        return HTTPStatus.OK, {
+            "price": price,
+            "formatted_price": formatted_price,
+            "property_type": search['property_type'],
+            "district": search['district'],
+            "commune": search['commune'],
+            "latitude": search['latitude'],
+            "longitude": search['longitude'],
+            "size": search['size_value'],
+            "bedrooms": search['bedrooms_value'],
+            "bathrooms": search['bathrooms_value'],
+        }
+
+    async def send(self, writer, status, payload, keep_alive):
+        # Infinity and NaN are not JSON; fail here rather than send them.
+        body = json.dumps(payload, allow_nan=False).encode('utf-8')
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve property price estimates over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="most requests scored in one predict call")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT * 1000,
+                        help="longest a request waits for others to batch with")
+    parser.add_argument('--log-searches', action='store_true', help="record every estimate in the search history")
+    args = parser.parse_args()
+
+    server = ValuationServer(args.host, args.port, args.max_batch_size, args.max_wait_ms / 1000, args.log_searches)
+
+    async def run():
+        port = await server.start()
+        print(f"Serving estimates on http://{args.host}:{port}")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
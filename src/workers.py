@@ -0,0 +1,249 @@
+import logging
+import time
+import traceback
+from PyQt6 import sip
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from comparables import get_comparables_index
+from metrics import measure, observe
+from model import MODEL_FILES, MODEL_VERSIONS, estimate_price, get_model, is_model_loaded, prediction_cache, watch_models
+from prediction_cache import PREDICTION_CACHE_DB
+from search_database import save_search
+from sensitivity import surface_cache
+
+logger = logging.getLogger(__name__)
+
+def _emit(signals, name, *args):
+    """Emit signals.<name>(*args) unless the signals object is gone.
+
+    If the app exits while a worker runs, its signals object can be deleted
+    under it; emitting then raises RuntimeError, which PyQt6 turns into an abort.
+    """
+    if sip.isdeleted(signals):
+        return
+    try:
+        getattr(signals, name).emit(*args)
+    except RuntimeError:
+        pass  # deleted since the check
+
+def _emit_result(worker, name, result):
+    """Emit worker.signals.<name>(generation, result) unless the worker was cancelled."""
+    if not worker.is_cancelled():
+        _emit(worker.signals, name, worker.generation, result)
+
+class ValuationSignals(QObject):
+    """Signals a ValuationWorker emits back to the GUI thread."""
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+class ValuationWorker(QRunnable):
+    """Estimate a price and record it in the search history off the GUI thread.
+
+    `search` holds the validated form values: property_type (display text),
+    property_type_id, district, commune, latitude, longitude, size_value,
+    bedrooms_value and bathrooms_value. On success `finished` carries the
+    same dict with `price` and the saved search's `search_id` added.
+    """
+
+    def __init__(self, search):
+        super().__init__()
+        self.search = dict(search)
+        self.signals = ValuationSignals()
+        self._cancelled = False
+
+    def cancel(self):
+        """Ask the worker to stop; checked between steps."""
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        with measure("ValuationWorker.run"):
+            self._run()
+
+    def _run(self):
+        search = self.search
+        try:
+            if not is_model_loaded(search['property_type_id']):
+                # Waits for the warm-up if it is already loading this model.
+                _emit(self.signals, 'progress', 5, "Loading model...")
+                get_model(search['property_type_id'])
+            _emit(self.signals, 'progress', 10, "Estimating price...")
+            # Read first: if a new model is swapped in meanwhile, the search is
+            # labelled with the older version and revalue_history prices it again.
+            model_version = MODEL_VERSIONS[search['property_type_id']]
+            search['price'] = estimate_price(
+                search['property_type_id'], search['latitude'], search['longitude'],
+                search['size_value'], search['bedrooms_value'], search['bathrooms_value'])
+            if self._cancelled:
+                _emit(self.signals, 'cancelled')
+                return
+
+            _emit(self.signals, 'progress', 60, "Saving search...")
+            saved = save_search(search['property_type'], search['district'], search['commune'], search['price'],
+                                search['size_value'], search['bedrooms_value'], search['bathrooms_value'],
+                                model_version)
+            # Lets the result window leave this search out of its comparables.
+            search['search_id'] = saved.result()
+            _emit(self.signals, 'progress', 100, "Done")
+            _emit(self.signals, 'finished', search)
+        except Exception:
+            _emit(self.signals, 'failed', traceback.format_exc())
+
+class PreviewSignals(QObject):
+    """Signals a PreviewWorker emits back to the GUI thread."""
+    finished = pyqtSignal(int, str)
+    failed = pyqtSignal(int, str)
+
+class PreviewWorker(QRunnable):
+    """Estimate a price for the live preview without saving the search.
+
+    `generation` is echoed back with the result so the form can drop
+    results for input that has changed since the job started. After
+    cancel() nothing is emitted.
+    """
+
+    def __init__(self, generation, search):
+        super().__init__()
+        self.generation = generation
+        self.search = dict(search)
+        self.signals = PreviewSignals()
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        search = self.search
+        try:
+            with measure("PreviewWorker.run"):
+                price = estimate_price(
+                    search['property_type_id'], search['latitude'], search['longitude'],
+                    search['size_value'], search['bedrooms_value'], search['bathrooms_value'])
+        except Exception:
+            _emit_result(self, 'failed', traceback.format_exc())
+        else:
+            _emit_result(self, 'finished', price)
+
+class SurfaceSignals(QObject):
+    """Signals a SurfaceWorker emits back to the GUI thread."""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class SurfaceWorker(QRunnable):
+    """Build the what-if price surface for a result off the GUI thread.
+
+    `finished` carries `generation` and the PriceSurface, which is also
+    left in surface_cache for the next result in the same commune. After
+    cancel() the surface is still built and cached but not emitted.
+    """
+
+    def __init__(self, generation, property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value):
+        super().__init__()
+        self.generation = generation
+        self.args = (property_type, latitude, longitude, size_value, bedrooms_value, bathrooms_value)
+        self.signals = SurfaceSignals()
+        self.done = False
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        try:
+            surface = surface_cache.get_or_build(*self.args)
+        except Exception:
+            _emit_result(self, 'failed', traceback.format_exc())
+        else:
+            _emit_result(self, 'finished', surface)
+        finally:
+            self.done = True
+
+class ComparablesSignals(QObject):
+    """Signals a ComparablesWorker emits back to the GUI thread."""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class ComparablesWorker(QRunnable):
+    """Find the past searches most like a result off the GUI thread.
+
+    The first one also loads the comparables index from the history.
+    `search_id`, if known, is the shown search's own id, left out of the
+    results. `finished` carries `generation` and the list of search rows;
+    after cancel() nothing is emitted.
+    """
+
+    def __init__(self, generation, property_type, district, commune, size_value, bedrooms_value, bathrooms_value,
+                 search_id=None):
+        super().__init__()
+        self.generation = generation
+        self.args = (property_type, district, commune, size_value, bedrooms_value, bathrooms_value)
+        self.search_id = search_id
+        self.signals = ComparablesSignals()
+        self.done = False
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        try:
+            rows = get_comparables_index().find(*self.args, exclude_id=self.search_id)
+        except Exception:
+            _emit_result(self, 'failed', traceback.format_exc())
+        else:
+            _emit_result(self, 'finished', rows)
+        finally:
+            self.done = True
+
+class WarmupSignals(QObject):
+    """Signals a ModelWarmupWorker emits back to the GUI thread."""
+    finished = pyqtSignal(float)
+    failed = pyqtSignal(str)
+
+class ModelWarmupWorker(QRunnable):
+    """Load every model in the background right after the first window paints.
+
+    Also attaches the persistent prediction cache and then starts watching
+    the model files for new versions. `finished` carries the total warm-up
+    time in seconds. If a model file is missing or fails to load, the other
+    models still load and `failed` carries the errors instead; that type is
+    loaded again when a search needs it.
+    """
+
+    def __init__(self, property_types=None):
+        super().__init__()
+        self.property_types = list(property_types or MODEL_FILES)
+        self.signals = WarmupSignals()
+
+    def run(self):
+        start = time.perf_counter()
+        errors = []
+        try:
+            prediction_cache.attach_database(PREDICTION_CACHE_DB)
+        except Exception:
+            logger.exception("Could not open the prediction cache")
+        for property_type in self.property_types:
+            try:
+                get_model(property_type)
+            except Exception as e:
+                logger.exception("Could not load %s", MODEL_FILES[property_type])
+                errors.append(f"{MODEL_FILES[property_type]}: {e}")
+        elapsed = time.perf_counter() - start
+        watch_models()
+        observe("startup.model_warmup", elapsed)
+        if errors:
+            _emit(self.signals, 'failed', "\n".join(errors))
+        else:
+            _emit(self.signals, 'finished', elapsed)